@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+'''Peak memory of an export, vars() of client resources vs compact records
+
+Stand-in clients serve generated users, projects, flavors, quotas and
+security groups as the clients build them, raw response and manager
+included. The export is run the way the exporters did before (vars() of
+every listed resource, stripped afterwards) and with the record types the
+exporters use now, peak memory is measured with tracemalloc.
+'''
+from openstack_portation import paging
+from openstack_portation import records
+from openstack_portation import settings
+from openstack_portation import utils
+from openstack_portation.openstack import cinder as os_cinder
+from openstack_portation.openstack import keystone as os_keystone
+from openstack_portation.openstack import neutron as os_neutron
+from openstack_portation.openstack import nova as os_nova
+
+import argparse
+import json
+import tracemalloc
+
+class StandInResource(object):
+    '''Resource as the clients build it, keeps raw info and its manager'''
+    def __init__(self, manager, info):
+        self.manager = manager
+        self._info = info
+        self._loaded = False
+        for key, value in info.items():
+            setattr(self, key, value)
+
+
+class StandInManager(object):
+    def __init__(self, items):
+        self.items = items
+
+    def _parse(self, items):
+        # Every response is parsed into new objects
+        return [StandInResource(self, info)
+                for info in json.loads(json.dumps(items))]
+
+    def list(self, limit=None, marker=None, is_public=None):
+        if is_public is False:
+            return []
+        start = 0
+        if marker is not None:
+            start = [i['id'] for i in self.items].index(marker) + 1
+        return self._parse(self.items[start:start + (limit or len(self.items))])
+
+    def get(self, obj_id):
+        return self._parse([dict(self.items[0], id=obj_id)])[0]
+
+    def list_users(self, tenant_id):
+        return []
+
+
+class StandInKeystone(object):
+    def __init__(self, count):
+        self.users = StandInManager([{
+            'id' : 'user-id-%d' % i, 'name' : 'user-%d' % i,
+            'username' : 'user-%d' % i, 'enabled' : True,
+            'email' : 'user-%d@example.com' % i, 'tenantId' : None,
+        } for i in range(count)])
+        self.tenants = StandInManager([{
+            'id' : 'tenant-id-%d' % i, 'name' : 'tenant-%d' % i,
+            'description' : 'generated project %d' % i, 'enabled' : True,
+        } for i in range(count)])
+        self.roles = StandInManager([])
+
+
+class StandInNova(object):
+    def __init__(self, count):
+        self.flavors = StandInManager([{
+            'id' : 'flavor-id-%d' % i, 'name' : 'flavor-%d' % i,
+            'ram' : 512, 'vcpus' : 1, 'disk' : 10, 'swap' : '',
+            'rxtx_factor' : 1.0, 'OS-FLV-EXT-DATA:ephemeral' : 0,
+            'os-flavor-access:is_public' : True,
+            'OS-FLV-DISABLED:disabled' : False,
+            'links' : [{'href' : 'http://nova/flavors/%d' % i,
+                        'rel' : 'self'}],
+        } for i in range(count)])
+        self.quotas = StandInManager([{
+            'cores' : 20, 'fixed_ips' : -1, 'floating_ips' : 10,
+            'injected_file_content_bytes' : 10240,
+            'injected_file_path_bytes' : 255, 'injected_files' : 5,
+            'instances' : 10, 'key_pairs' : 100, 'metadata_items' : 128,
+            'ram' : 51200, 'security_group_rules' : 20,
+            'security_groups' : 10, 'server_group_members' : 10,
+            'server_groups' : 10,
+        }])
+
+
+class StandInCinder(object):
+    def __init__(self):
+        self.quotas = StandInManager([{
+            'gigabytes' : 1000, 'snapshots' : 10, 'volumes' : 10,
+        }])
+
+
+class StandInNeutron(object):
+    def __init__(self, count):
+        rule = {
+            'direction' : 'ingress', 'protocol' : 'tcp', 'ethertype' : 'IPv4',
+            'port_range_min' : 22, 'port_range_max' : 22,
+            'remote_group_id' : None, 'remote_ip_prefix' : '0.0.0.0/0',
+        }
+        self.groups = [{
+            'id' : 'group-id-%d' % i, 'name' : 'group-%d' % i,
+            'description' : 'generated group %d' % i,
+            'tenant_id' : 'tenant-id-%d' % i,
+            'security_group_rules' : [dict(rule, id='rule-%d-%d' % (i, r))
+                                      for r in range(3)],
+        } for i in range(count)]
+
+    def list_security_groups(self, retrieve_all=True, limit=None):
+        for start in range(0, len(self.groups), limit):
+            page = self.groups[start:start + limit]
+            yield {'security_groups' : json.loads(json.dumps(page))}
+
+
+def strip(data, keys):
+    for key in keys:
+        data.pop(key, None)
+    return data
+
+def vars_export(keystone, nova, cinder, neutron):
+    # What the exporters did before, vars() of resources listed in one call
+    export = []
+    ignore = settings.EXPORT_KEYS_IGNORE
+    tenants = [t for t in keystone.tenants.list()
+               if t.name not in settings.EXPORT_SKIP_PROJECTS]
+    for user in keystone.users.list():
+        data = strip(dict(vars(user)), ignore + ['tenantId', 'username'])
+        export.append({'user' : utils.pretty_dict(data)})
+    for tenant in tenants:
+        data = strip(dict(vars(tenant)), ignore)
+        export.append({'project' : utils.pretty_dict(data)})
+    for flavor in nova.flavors.list():
+        data = strip(vars(flavor), ignore + ['OS-FLV-DISABLED:disabled'])
+        data['ephemeral'] = data.pop('OS-FLV-EXT-DATA:ephemeral', 0)
+        data['is_public'] = data.pop('os-flavor-access:is_public', True)
+        data['swap'] = 0 if data['swap'] == '' else int(data['swap'])
+        data['name'] = str(data['name'])
+        export.append({'flavor' : data})
+    groups = {}
+    for page in neutron.list_security_groups(limit=len(neutron.groups)):
+        for group in page['security_groups']:
+            rules = [os_neutron._nova_rule(rule) #pylint: disable=protected-access
+                     for rule in group['security_group_rules']]
+            groups.setdefault(group['tenant_id'], []).append({
+                'name' : str(group['name']),
+                'description' : str(group['description']),
+                'rules' : rules,
+            })
+    for tenant in tenants:
+        data = strip(vars(nova.quotas.get(tenant.id)), ignore)
+        data['tenant_name'] = str(tenant.name)
+        export.append({'nova_quota' : data})
+        data = strip(vars(cinder.quotas.get(tenant.id)), ignore)
+        data['tenant_name'] = str(tenant.name)
+        export.append({'cinder_quota' : data})
+        for group in groups.get(tenant.id, []):
+            export.append({'security_group' : group,
+                           'os_tenant_name' : str(tenant.name)})
+    return export
+
+def record_export(keystone, nova, cinder, neutron):
+    # Same stages as PortationClient.iter_export_config
+    export = []
+    export += os_keystone.save_keystone(keystone)
+    export += os_nova.save_flavors(nova)
+    tenants = [records.ProjectRecord.from_resource(t)
+               for t in paging.paged(keystone.tenants.list)
+               if t.name not in settings.EXPORT_SKIP_PROJECTS]
+    groups = os_neutron.security_groups_by_tenant(neutron)
+    for tenant in tenants:
+        export.append(os_nova.save_quotas(nova, tenant))
+        export.append(os_cinder.save_quotas(cinder, tenant))
+        export += os_neutron.save_security_groups(groups, tenant)
+    return export
+
+def measure(function, *clients):
+    tracemalloc.start()
+    export = function(*clients)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024.0 / 1024.0, export
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--objects', type=int, default=50000,
+                   help='Users, projects and security groups in stand-in')
+    args = p.parse_args()
+    clients = (StandInKeystone(args.objects), StandInNova(args.objects / 10),
+               StandInCinder(), StandInNeutron(args.objects))
+    before, vars_records = measure(vars_export, *clients)
+    after, compact_records = measure(record_export, *clients)
+    assert vars_records == compact_records
+    print('%d objects, %d records' % (args.objects, len(compact_records)))
+    print('vars() peak MB:   %10.1f' % before)
+    print('records peak MB:  %10.1f' % after)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+'''Bytes transferred per neutron find lookup, unfiltered vs filtered
+
+Runs a local stand-in neutron API serving generated networks, subnets and
+routers, then looks resources up the way utils did before (list all, filter
+locally) and with the server side filters utils uses now.
+'''
+from openstack_portation import utils
+
+from neutronclient.v2_0 import client as neutron_v2
+
+import argparse
+import json
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urllib import urlencode
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import urlencode, urlparse, parse_qs
+
+def generate(count):
+    data = {'networks' : [], 'subnets' : [], 'routers' : []}
+    for i in range(count):
+        tenant_id = 'tenant-%d' % (i % 100)
+        network_id = 'net-id-%d' % i
+        data['networks'].append({
+            'id' : network_id, 'name' : 'net-%d' % i, 'tenant_id' : tenant_id,
+            'admin_state_up' : True, 'shared' : False, 'status' : 'ACTIVE',
+            'subnets' : ['sub-id-%d' % i], 'router:external' : False,
+        })
+        data['subnets'].append({
+            'id' : 'sub-id-%d' % i, 'name' : 'sub-%d' % i,
+            'tenant_id' : tenant_id, 'network_id' : network_id,
+            'cidr' : '10.%d.%d.0/24' % (i / 256 % 256, i % 256),
+            'ip_version' : 4, 'enable_dhcp' : True, 'gateway_ip' : None,
+            'allocation_pools' : [], 'dns_nameservers' : [],
+            'host_routes' : [],
+        })
+        data['routers'].append({
+            'id' : 'router-id-%d' % i, 'name' : 'router-%d' % i,
+            'tenant_id' : tenant_id, 'status' : 'ACTIVE',
+            'admin_state_up' : True, 'external_gateway_info' : None,
+        })
+    return data
+
+
+class StandInNeutron(BaseHTTPRequestHandler):
+    data = {}
+    bytes_sent = 0
+
+    def do_GET(self): #pylint: disable=invalid-name
+        url = urlparse(self.path)
+        resource = url.path.rstrip('/').split('/')[-1].replace('.json', '')
+        query = parse_qs(url.query)
+        fields = query.pop('fields', None)
+        # Paging parameters are not filters
+        limit = int(query.pop('limit', [0])[0])
+        marker = query.pop('marker', [None])[0]
+        items = [i for i in self.data.get(resource, [])
+                 if all(i.get(k) in v for k, v in query.items())]
+        if marker is not None:
+            ids = [i['id'] for i in items]
+            items = items[ids.index(marker) + 1:] if marker in ids else []
+        response = {}
+        if limit and len(items) > limit:
+            items = items[:limit]
+            next_query = dict(query, limit=[limit], marker=[items[-1]['id']])
+            if fields:
+                next_query['fields'] = fields
+            response[resource + '_links'] = [{
+                'rel' : 'next',
+                'href' : '%s?%s' % (url.path, urlencode(next_query, True)),
+            }]
+        if fields:
+            items = [dict((k, i[k]) for k in fields if k in i) for i in items]
+        response[resource] = items
+        body = json.dumps(response).encode('utf-8')
+        StandInNeutron.bytes_sent += len(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): #pylint: disable=arguments-differ
+        pass
+
+
+def unfiltered_lookups(neutron, i):
+    # What utils did before, list everything and filter locally
+    for net in neutron.list_networks()['networks']:
+        if net['name'] == 'net-%d' % i:
+            break
+    for sub in neutron.list_subnets()['subnets']:
+        if sub['name'] == 'sub-%d' % i:
+            break
+    for router in neutron.list_routers()['routers']:
+        if router['name'] == 'router-%d' % i:
+            break
+
+def filtered_lookups(neutron, i):
+    utils.name_index.invalidate()
+    utils.find_network(neutron, 'net-%d' % i, None)
+    utils.find_subnet(neutron, 'sub-%d' % i, None, None)
+    utils.find_router(neutron, 'router-%d' % i, None)
+
+def measure(function, neutron, lookups):
+    StandInNeutron.bytes_sent = 0
+    for i in range(lookups):
+        function(neutron, i)
+    return StandInNeutron.bytes_sent / float(lookups * 3)
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--resources', type=int, default=40000,
+                   help='Networks, subnets and routers each in stand-in')
+    p.add_argument('--lookups', type=int, default=20)
+    args = p.parse_args()
+    StandInNeutron.data = generate(args.resources)
+    server = HTTPServer(('127.0.0.1', 0), StandInNeutron)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    neutron = neutron_v2.Client(endpoint_url='http://127.0.0.1:%s' %
+                                server.server_port, token='benchmark')
+    before = measure(unfiltered_lookups, neutron, args.lookups)
+    after = measure(filtered_lookups, neutron, args.lookups)
+    server.shutdown()
+    print('%d resources per type, %d lookups' % (args.resources, args.lookups))
+    print('unfiltered bytes per lookup: %12.0f' % before)
+    print('filtered bytes per lookup:   %12.0f' % after)
+
+if __name__ == '__main__':
+    main()
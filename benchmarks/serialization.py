@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''Time loading and dumping a generated import config in each format'''
+from openstack_portation import serialize
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import yaml
+
+def generate_config(actions):
+    config = []
+    for i in range(actions):
+        name = 'tenant-%06d' % i
+        config.append({
+            'project' : {
+                'name' : name,
+                'description' : 'generated project %d' % i,
+            },
+            'nova_quota' : {
+                'tenant_name' : name,
+                'instances' : 20,
+                'cores' : 80,
+                'ram' : 5120000,
+            },
+            'network' : {
+                'name' : 'net-%06d' % i,
+                'tenant_name' : name,
+            },
+        })
+    return config
+
+def timed(function):
+    start = time.time()
+    result = function()
+    return time.time() - start, result
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--actions', type=int, default=100000)
+    args = p.parse_args()
+    config = generate_config(args.actions)
+    directory = tempfile.mkdtemp()
+    formats = [f for f in serialize.FORMATS
+               if f != 'msgpack' or serialize.msgpack is not None]
+    print('%d actions, yaml loader:%s' % (args.actions,
+                                          serialize.YamlLoader.__name__))
+    print('%-12s %10s %10s %10s' % ('format', 'dump(s)', 'load(s)', 'size(MB)'))
+    try:
+        for file_format in formats:
+            path = os.path.join(directory, 'config.%s' % file_format)
+            dump_time, _ = timed(lambda: serialize.write_records(path, config,
+                                                                 file_format))
+            load_time, loaded = timed(lambda: serialize.load_records(path,
+                                                                     file_format))
+            assert len(loaded) == len(config)
+            size = os.path.getsize(path) / 1024.0 / 1024.0
+            print('%-12s %10.2f %10.2f %10.1f' % (file_format, dump_time,
+                                                  load_time, size))
+        # pure python loader the CLI used before, for comparison
+        path = os.path.join(directory, 'config.yaml')
+        with open(path, 'r') as f:
+            load_time, _ = timed(lambda: yaml.load(f, Loader=yaml.SafeLoader))
+        print('%-12s %10s %10.2f' % ('yaml-python', '-', load_time))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
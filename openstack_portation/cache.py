@@ -0,0 +1,122 @@
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+def _object_id(obj):
+    try:
+        return obj.id
+    except AttributeError:
+        return obj['id']
+
+class NameIndex(object):
+    '''In memory name -> objects index of listed resources
+
+    Each resource type is listed once per scope, all following lookups are
+    served out of the index. Scope is taken from the "index_scope" attribute
+    of the client, which the PortationClient sets to the credentials used,
+    falling back to the client object itself.
+
+    Resources that are too large to list are looked up with server side
+    filters instead, each distinct set of filters is queried once.
+    '''
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._tables = {}
+        self._filtered = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def scope(client):
+        return getattr(client, 'index_scope', None) or client
+
+    def find(self, client, resource, name, list_function):
+        '''Return list of objects with name, list resources if not indexed'''
+        key = (self.scope(client), resource)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self.hits += 1
+                return list(table.get(name, []))
+            self.misses += 1
+        log.debug('Name index miss, listing resource:%s' % resource)
+        table = {}
+        for name_key, obj in list_function():
+            table.setdefault(name_key, []).append(obj)
+        with self._lock:
+            self._tables[key] = table
+        return list(table.get(name, []))
+
+    def find_filtered(self, client, resource, filters, lookup):
+        '''Return objects for dict of filters, call lookup if not indexed'''
+        key = (self.scope(client), resource)
+        filter_key = tuple(sorted(filters.items()))
+        with self._lock:
+            table = self._filtered.get(key, {})
+            if filter_key in table:
+                self.hits += 1
+                return list(table[filter_key])
+            self.misses += 1
+        log.debug('Name index miss, looking up %s:%s' % (resource, filters))
+        objs = list(lookup())
+        with self._lock:
+            self._filtered.setdefault(key, {})[filter_key] = objs
+        return list(objs)
+
+    def add(self, client, resource, name, obj):
+        '''Add or replace object in index, ignored if resource not indexed'''
+        key = (self.scope(client), resource)
+        with self._lock:
+            # Filtered results with the name may now be incomplete
+            table = self._filtered.get(key, {})
+            for filter_key in list(table.keys()):
+                if dict(filter_key).get('name') == name:
+                    table.pop(filter_key)
+            table = self._tables.get(key)
+            if table is None:
+                return
+            self._remove(table, _object_id(obj))
+            table.setdefault(name, []).insert(0, obj)
+
+    def remove(self, client, resource, obj_id):
+        key = (self.scope(client), resource)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._remove(table, obj_id)
+            table = self._filtered.get(key)
+            if table is not None:
+                self._remove(table, obj_id)
+
+    @staticmethod
+    def _remove(table, obj_id):
+        for name in list(table.keys()):
+            table[name] = [i for i in table[name] if _object_id(i) != obj_id]
+            if not table[name]:
+                table.pop(name)
+
+    def invalidate(self, resource=None, client=None):
+        '''Drop indexed resources, optionally only for resource type or scope'''
+        scope = self.scope(client) if client is not None else None
+        with self._lock:
+            for tables in [self._tables, self._filtered]:
+                for key in list(tables.keys()):
+                    if scope is not None and key[0] != scope:
+                        continue
+                    if resource is not None and key[1] != resource:
+                        continue
+                    tables.pop(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits' : self.hits,
+                'misses' : self.misses,
+                # every hit is a list call that did not have to be made
+                'api_calls_saved' : self.hits,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
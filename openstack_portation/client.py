@@ -1,6 +1,15 @@
 from openstack_portation import settings
+from openstack_portation import paging
+from openstack_portation import plan
+from openstack_portation import records
 from openstack_portation import schema
+from openstack_portation import scheduler
 from openstack_portation import utils
+from openstack_portation.exceptions import OpenStackPortationError
+from openstack_portation.journal import action_hash
+from openstack_portation.pool import ClientBundle, ClientPool
+from openstack_portation.trace import tracer
+from openstack_portation.waits import DeferredWaits
 
 from openstack_portation.openstack import cinder as os_cinder
 from openstack_portation.openstack import glance as os_glance
@@ -8,14 +17,13 @@ from openstack_portation.openstack import keystone as os_keystone
 from openstack_portation.openstack import neutron as os_neutron
 from openstack_portation.openstack import nova as os_nova
 
-from cinderclient.v1 import client as cinder_v1
-from glanceclient import Client as glance_client
-from keystoneclient.v2_0 import client as key_v2
-from neutronclient.v2_0 import client as neutron_v2
 from novaclient.v1_1 import client as nova_v1 #pylint: disable=no-name-in-module
 
-from jsonschema import validate
+from concurrent.futures import ThreadPoolExecutor
+import copy
 import logging
+import os
+import threading
 
 log = logging.getLogger(__name__)
 
@@ -38,6 +46,95 @@ SECTION_SCHEMA = {
 
 SECTION_KEYS = SECTION_SCHEMA.keys() + ['os_tenant_name']
 
+# Function returning (action, changes) each section would make, no writes
+PLAN_SCHEMA = {
+    'user' : lambda c, d: os_keystone.plan_user(c.keystone, **d),
+    'project' : lambda c, d: os_keystone.plan_project(c.keystone, **d),
+    'flavor' : lambda c, d: os_nova.plan_flavor(c.nova, **d),
+    'nova_quota' : lambda c, d: os_nova.plan_nova_quota(c.nova, c.keystone,
+                                                        **d),
+    'cinder_quota' : lambda c, d: os_cinder.plan_cinder_quota(c.cinder,
+                                                              c.keystone, **d),
+    'security_group' : lambda c, d: os_nova.plan_security_group(c.nova, **d),
+    'keypair' : lambda c, d: os_nova.plan_keypair(c.nova, **d),
+    # local file is always written
+    'source_file' : lambda c, d: (plan.CREATE, {}),
+    'image' : lambda c, d: os_glance.plan_image(c.glance, **d),
+    'network' : lambda c, d: os_neutron.plan_network(c.neutron, c.keystone,
+                                                     **d),
+    'subnet' : lambda c, d: os_neutron.plan_subnet(c.neutron, c.keystone, **d),
+    'router' : lambda c, d: os_neutron.plan_router(c.neutron, c.keystone, **d),
+    'volume' : lambda c, d: os_cinder.plan_volume(c.cinder, **d),
+    'server' : lambda c, d: os_nova.plan_server(c.nova, **d),
+}
+
+def _neutron_ids(list_function, resource, ids):
+    # Only ask neutron about the ids, and only for their ids
+    return set(r['id'] for r in
+               list_function(id=ids, fields=['id'])[resource + 's'])
+
+def _existing_ids(client, resource, get_function, ids):
+    # Get each id through the index, never list the whole collection
+    return set(i for i in ids
+               if utils.find_by_id(client, resource, i, get_function))
+
+def _glance_image(glance, image_id):
+    # glance v1 still gets deleted images
+    image = glance.images.get(image_id)
+    return None if getattr(image, 'deleted', False) else image
+
+# Function returning which of list of result ids still exist, neutron takes
+# .. all ids of a section type in one call, others get each id
+EXISTS_SCHEMA = {
+    'user' : lambda c, ids: _existing_ids(c.keystone, 'user',
+                                          c.keystone.users.get, ids),
+    'project' : lambda c, ids: _existing_ids(c.keystone, 'project',
+                                             c.keystone.tenants.get, ids),
+    'nova_quota' : lambda c, ids: _existing_ids(c.keystone, 'project',
+                                                c.keystone.tenants.get, ids),
+    'cinder_quota' : lambda c, ids: _existing_ids(c.keystone, 'project',
+                                                  c.keystone.tenants.get,
+                                                  ids),
+    'flavor' : lambda c, ids: _existing_ids(c.nova, 'flavor',
+                                            c.nova.flavors.get, ids),
+    'security_group' : lambda c, ids: _existing_ids(
+        c.nova, 'security_group', c.nova.security_groups.get, ids),
+    'keypair' : lambda c, ids: _existing_ids(c.nova, 'keypair',
+                                             c.nova.keypairs.get, ids),
+    'source_file' : lambda c, ids: set(i for i in ids if os.path.isfile(i)),
+    'image' : lambda c, ids: _existing_ids(
+        c.glance, 'glance_image', lambda i: _glance_image(c.glance, i), ids),
+    'network' : lambda c, ids: _neutron_ids(c.neutron.list_networks,
+                                            'network', ids),
+    'subnet' : lambda c, ids: _neutron_ids(c.neutron.list_subnets,
+                                           'subnet', ids),
+    'router' : lambda c, ids: _neutron_ids(c.neutron.list_routers,
+                                           'router', ids),
+    'volume' : lambda c, ids: _existing_ids(c.cinder, 'volume',
+                                            c.cinder.volumes.get, ids),
+    'server' : lambda c, ids: _existing_ids(c.nova, 'server',
+                                            c.nova.servers.get, ids),
+}
+
+# Sections of consecutive actions created together by one method call
+BULK_SCHEMA = {
+    'network' : 'create_networks',
+    'subnet' : 'create_subnets',
+}
+
+# lister, accept states, reject states, timeout, interval for each waitable
+WAIT_SCHEMA = {
+    'image' : (lambda c: os_glance.image_lister(c.glance),
+               ['active'], ['error'],
+               settings.IMAGE_WAIT_TIMEOUT, settings.IMAGE_WAIT_INTERVAL),
+    'volume' : (lambda c: os_cinder.volume_lister(c.cinder),
+                ['available'], ['error'],
+                settings.VOLUME_WAIT_TIMEOUT, settings.VOLUME_WAIT_INTERVAL),
+    'server' : (lambda c: os_nova.server_lister(c.nova),
+                ['ACTIVE'], ['ERROR'],
+                settings.SERVER_WAIT_TIMEOUT, settings.SERVER_WAIT_INTERVAL),
+}
+
 class PortationResults(list):
     '''Custom Account Client Results'''
     def __add__(self, new_item):
@@ -71,29 +168,20 @@ class PortationClient(object): #pylint: disable=too-many-instance-attributes
         self.os_tenant_name = tenant_name
         self.os_auth_url = auth_url
         self.keystone = self.nova = self.cinder = self.neutron = self.glance = None
+        self.pool = ClientPool()
+        # Every API call made through the pooled clients
+        self.metrics = self.pool.http.metrics
         self.__reset_clients(self.os_username, self.os_password,
                              self.os_tenant_name, self.os_auth_url)
 
     def __reset_clients(self, username, password, tenant_name, auth_url):
-        self.keystone = key_v2.Client(username=username,
-                                      password=password,
-                                      tenant_name=tenant_name,
-                                      auth_url=auth_url)
-        self.nova = nova_v1.Client(username,
-                                   password,
-                                   tenant_name,
-                                   auth_url)
-        self.cinder = cinder_v1.Client(username,
-                                       password,
-                                       tenant_name,
-                                       auth_url)
-        self.neutron = neutron_v2.Client(username=username,
-                                         password=password,
-                                         tenant_name=tenant_name,
-                                         auth_url=auth_url)
-        token = self.keystone.auth_token
-        image_endpoint = self.keystone.service_catalog.url_for(service_type='image')
-        self.glance = glance_client('1', endpoint=image_endpoint, token=token)
+        # Reuse authenticated clients for credentials already seen
+        bundle = self.pool.get(username, password, tenant_name, auth_url)
+        self.keystone = bundle.keystone
+        self.nova = bundle.nova
+        self.cinder = bundle.cinder
+        self.neutron = bundle.neutron
+        self.glance = bundle.glance
 
     def create_user(self, **args):
         return os_keystone.create_user(self.keystone, **args)
@@ -146,6 +234,12 @@ class PortationClient(object): #pylint: disable=too-many-instance-attributes
     def create_subnet(self, **args):
         return os_neutron.create_subnet(self.neutron, self.keystone, **args)
 
+    def create_networks(self, sections):
+        return os_neutron.create_networks(self.neutron, self.keystone, sections)
+
+    def create_subnets(self, sections):
+        return os_neutron.create_subnets(self.neutron, self.keystone, sections)
+
     def create_router(self, **args):
         return os_neutron.create_router(self.neutron, self.keystone, **args)
 
@@ -155,6 +249,30 @@ class PortationClient(object): #pylint: disable=too-many-instance-attributes
     def create_server(self, **args):
         return os_nova.create_server(self.nova, self.neutron, self.cinder, **args)
 
+    def wait_for(self, key, obj_ids, timeout=None, interval=None):
+        '''Wait on many images, volumes or servers, polling them together'''
+        lister, accept, reject, default_timeout, default_interval = \
+            WAIT_SCHEMA[key]
+        log.info('Waiting for %s %ss' % (len(obj_ids), key))
+        if timeout is None:
+            timeout = default_timeout
+        with tracer.span('wait %s' % key, 'wait', count=len(obj_ids)):
+            return utils.wait_statuses(lister(self), obj_ids, accept, reject,
+                                       interval or default_interval, timeout)
+
+    @staticmethod
+    def __pop_wait(key, data):
+        # Take wait args out of section so the wait can be done later
+        if not settings.DEFER_WAITS or key not in WAIT_SCHEMA:
+            return None
+        if not data.pop('wait', False):
+            return None
+        _, _, _, timeout, interval = WAIT_SCHEMA[key]
+        timeout = data.pop('timeout', timeout)
+        interval = data.pop('interval', interval)
+        interval = data.pop('wait_interval', interval)
+        return timeout, interval
+
     def __set_client_auth(self, username, password, tenant_name, auth_url):
         # Allow for the override of openstack auth args in each action
         # New args will be applied for every section in that action
@@ -164,64 +282,430 @@ class PortationClient(object): #pylint: disable=too-many-instance-attributes
         auth_url = auth_url or self.os_auth_url
         self.__reset_clients(username, password, tenant_name, auth_url,)
 
-    def import_config(self, config):
-        log.debug('Checking schema')
-        validate(config, schema.SCHEMA)
+    def __run_node(self, node):
+        # Workers run on a copy of the client so credential overrides
+        # .. of one action do not swap the clients used by another
+        worker = copy.copy(self)
+        worker.__set_client_auth(node.auth.get('os_username'),
+                                 node.auth.get('os_password'),
+                                 node.auth.get('os_tenant_name'),
+                                 node.auth.get('os_auth_url'),)
+        method = getattr(worker, SECTION_SCHEMA[node.key])
+        with tracer.span('%s %s' % (node.key, node.data.get('name', '')),
+                         'section', action=node.action_index):
+            return method(**node.data)
+
+    def __import_graph(self, config, concurrency, done, record):
+        # Run sections as soon as the sections they reference are done
+        # .. actions completed by an earlier run have no sections to run
+        nodes = scheduler.build_graph([{} if i in done else action
+                                       for i, action in enumerate(config)])
+        log.info('Importing %s sections with concurrency:%s' %
+                 (len(nodes), concurrency))
+        action_results = {}
+        remaining = {}
+        for node in nodes:
+            remaining.setdefault(node.action_index, 0)
+            remaining[node.action_index] += 1
+        lock = threading.Lock()
+        def run_node(node):
+            result = self.__run_node(node)
+            with lock:
+                action_results.setdefault(node.action_index, [])
+                if result:
+                    action_results[node.action_index].append(result)
+                remaining[node.action_index] -= 1
+                if not remaining[node.action_index]:
+                    record(node.action_index,
+                           action_results[node.action_index])
+            return result
+        results, errors = scheduler.run_graph(nodes, run_node, concurrency)
+        return_data = PortationResults()
+        for index in sorted(done):
+            return_data += done[index]
+        for _, result in results:
+            if result:
+                return_data.append(result)
+        self.__log_stats(return_data)
+        if errors:
+            error = OpenStackPortationError('Failed sections:%s' %
+                                            ', '.join('%s:%s' % (node, e)
+                                                      for node, e in errors))
+            error.results = return_data
+            raise error
+        return return_data
+
+    def __log_stats(self, return_data):
+        log.info('Finished with results :%s' % return_data)
+        log.info('Name index stats:%s' % utils.name_index.stats())
+        log.info('Client pool stats:%s' % self.pool.stats())
+        log.info('HTTP connection stats:%s' % self.pool.http.stats())
+        log.info('Throttle stats:%s' % self.pool.http.throttle.stats())
+
+    @staticmethod
+    def __bulk_actions(config, start, done):
+        # Consecutive actions with one section of the same bulk type
+        # .. and the same auth are created together
+        def bulk_key(action):
+            keys = [k for k in action if k not in scheduler.AUTH_KEYS]
+            if len(keys) != 1 or keys[0] not in BULK_SCHEMA:
+                return None
+            return keys[0], [action.get(k) for k in scheduler.AUTH_KEYS]
+        if not settings.NEUTRON_BULK_CREATE:
+            return []
+        key = bulk_key(config[start])
+        if key is None:
+            return []
+        end = start + 1
+        while end < len(config) and end not in done and \
+                bulk_key(config[end]) == key:
+            end += 1
+        return config[start:end]
+
+    def __import_bulk(self, start, actions, validator):
+        # Return list of results of each action
+        if validator:
+            for index in range(start, start + len(actions)):
+                validator.wait(index)
+        self.__set_client_auth(*[actions[0].get(k) for k in scheduler.AUTH_KEYS])
+        key = [k for k in actions[0] if k not in scheduler.AUTH_KEYS][0]
+        method = getattr(self, BULK_SCHEMA[key])
+        with tracer.span('%s x%s' % (key, len(actions)), 'section'):
+            results = method([action[key] for action in actions])
+        return [[result] if result else [] for result in results]
+
+    def __import_action(self, index, action, validator, waits, return_data):
+        if validator:
+            with tracer.span('validate action', 'local'):
+                validator.wait(index)
+        # for each item reset the openstack clients used
+        # .. take either the arguments provided by the user
+        # .. or the arguments that are used when authenticating
+        # .. the initial client
+        self.__set_client_auth(action.pop('os_username', None),
+                               action.pop('os_password', None),
+                               action.pop('os_tenant_name', None),
+                               action.pop('os_auth_url', None),)
+        for key, data in action.iteritems():
+            # Block on images, volumes and servers still being built
+            # .. only when this section uses them
+            waits.wait_refs(scheduler.section_refs(key, data, {}))
+            name = data.get('name')
+            wait_args = self.__pop_wait(key, data)
+            method = getattr(self, SECTION_SCHEMA[key])
+            with tracer.span('%s %s' % (key, name or ''), 'section'):
+                result = method(**data)
+            if result:
+                return_data.append(result)
+                if wait_args:
+                    waits.add(copy.copy(self), key, name, result[key],
+                              *wait_args)
+
+    def __section_prints(self, config):
+        # Fingerprint of each section, the hash of its spec and the
+        # .. credentials it is imported with
+        prints = []
+        for action in config:
+            username = action.get('os_username') or self.os_username
+            tenant_name = action.get('os_tenant_name') or self.os_tenant_name
+            auth_url = action.get('os_auth_url') or self.os_auth_url
+            prints.append(dict(
+                (key, (auth_url, key, action_hash({'user' : username,
+                                                   'tenant' : tenant_name,
+                                                   'section' : data})))
+                for key, data in action.iteritems()
+                if key not in scheduler.AUTH_KEYS))
+        return prints
+
+    def __fingerprinted(self, config, fingerprints, prints, done):
+        # Return results of actions whose sections all have stored
+        # .. fingerprints and resources that still exist
+        candidates = {}
+        for index, action_prints in enumerate(prints):
+            if index in done or not action_prints:
+                continue
+            if any(key not in EXISTS_SCHEMA for key in action_prints):
+                continue
+            cached = [(key, fingerprints.get(*fingerprint))
+                      for key, fingerprint in action_prints.items()]
+            if all(result for _, result in cached):
+                candidates[index] = cached
+        # One existence check per section type and credentials
+        ids = {}
+        for index, cached in candidates.items():
+            auth = tuple(config[index].get(k) for k in scheduler.AUTH_KEYS)
+            for key, result in cached:
+                ids.setdefault((key, auth), set()).add(result[key])
+        existing = {}
+        for (key, auth), key_ids in ids.items():
+            self.__set_client_auth(*auth)
+            existing[(key, auth)] = EXISTS_SCHEMA[key](self, sorted(key_ids))
+        self.__set_client_auth(None, None, None, None)
+        unchanged = {}
+        for index, cached in candidates.items():
+            auth = tuple(config[index].get(k) for k in scheduler.AUTH_KEYS)
+            if all(result[key] in existing[(key, auth)]
+                   for key, result in cached):
+                unchanged[index] = [result for _, result in cached]
+                fingerprints.verified(prints[index].values())
+        log.info('Skipping %s unchanged actions, %s checked' %
+                 (len(unchanged), len(candidates)))
+        return unchanged
+
+    @staticmethod
+    def __record_prints(fingerprints, action_prints, results):
+        for result in results:
+            key = [k for k in result if k != 'os_tenant_name'][0]
+            if key in action_prints:
+                fingerprints.put(*(action_prints[key] + (result,)))
+
+    def import_config(self, config, concurrency=None, journal=None,
+                      fingerprints=None):
+        '''Import list of actions, return PortationResults
+
+        With a Journal each completed action is recorded in it, actions it
+        already has with the same spec are skipped. With a FingerprintStore
+        actions imported before with the same spec are skipped when their
+        resources still exist.
+        '''
+        concurrency = concurrency or settings.IMPORT_CONCURRENCY
+        self.pool.http.ensure_size(concurrency)
+        # Index is scoped to one run, resources may change between runs
+        utils.name_index.invalidate()
+        if concurrency > 1 or not settings.VALIDATE_INCREMENTAL:
+            log.debug('Checking schema')
+            with tracer.span('validate config', 'local'):
+                schema.validate_config(config)
+            validator = None
+        else:
+            # Actions are checked in the background, each action
+            # .. only waits for its own check to finish
+            validator = schema.ActionValidator(config)
+        # Hash specs before sections are run, running pops keys from them
+        hashes = []
+        prints = []
+        done = {}
+        if journal:
+            hashes = [action_hash(action) for action in config]
+            for index, spec_hash in enumerate(hashes):
+                results = journal.completed(index, spec_hash)
+                if results is not None:
+                    done[index] = results
+            log.info('Skipping %s actions completed by an earlier run' %
+                     len(done))
+        if fingerprints:
+            prints = self.__section_prints(config)
+            done.update(self.__fingerprinted(config, fingerprints, prints,
+                                             done))
+        def record(index, results):
+            if journal:
+                journal.commit(index, hashes[index], results)
+            if fingerprints:
+                self.__record_prints(fingerprints, prints[index], results)
+        if concurrency > 1:
+            return self.__import_graph(config, concurrency, done, record)
         # schema is a list of items
         # .. we'll call these items 'actions'
         return_data = PortationResults()
-        for action in config:
-            # for each item reset the openstack clients used
-            # .. take either the arguments provided by the user
-            # .. or the arguments that are used when authenticating
-            # .. the initial client
-            self.__set_client_auth(action.pop('os_username', None),
-                                   action.pop('os_password', None),
-                                   action.pop('os_tenant_name', None),
-                                   action.pop('os_auth_url', None),)
-            for key, data in action.iteritems():
-                method = getattr(self, SECTION_SCHEMA[key])
-                result = method(**data)
-                if result:
-                    return_data.append(result)
-        log.info('Finished with results :%s' % return_data)
+        waits = DeferredWaits()
+        index = 0
+        while index < len(config):
+            if index in done:
+                return_data += done[index]
+                index += 1
+                continue
+            actions = self.__bulk_actions(config, index, done)
+            if len(actions) > 1:
+                with tracer.span('actions %s-%s' % (index,
+                                                    index + len(actions) - 1),
+                                 'action'):
+                    action_results = self.__import_bulk(index, actions,
+                                                        validator)
+            else:
+                start = len(return_data)
+                with tracer.span('action %s' % index, 'action'):
+                    self.__import_action(index, config[index], validator,
+                                         waits, return_data)
+                action_results = [return_data[start:]]
+                del return_data[start:]
+            for results in action_results:
+                return_data += results
+                record(index, results)
+                index += 1
+        waits.wait_all()
+        log.info('Deferred wait stats:%s' % waits.stats())
+        self.__log_stats(return_data)
         return return_data
 
-    def export_config(self):
+    def plan_config(self, config):
+        '''Return list of PlanEntry, the changes import_config would make
+
+        Nothing is written, existing resources are listed once each through
+        the name index and compared with each section.
+        '''
+        schema.validate_config(config)
+        utils.name_index.invalidate()
+        entries = []
+        for index, action in enumerate(config):
+            self.__set_client_auth(*[action.get(k) for k in scheduler.AUTH_KEYS])
+            for key, data in action.iteritems():
+                if key in scheduler.AUTH_KEYS:
+                    continue
+                name = data.get('name') or data.get('tenant_name')
+                with tracer.span('plan %s %s' % (key, name or ''), 'section'):
+                    action_name, changes = PLAN_SCHEMA[key](
+                        self, copy.deepcopy(data))
+                entries.append(plan.PlanEntry(index, key, name, action_name,
+                                              changes))
+        counts = plan.summary(entries)
+        log.info('Planned %s creates, %s updates, %s unchanged' %
+                 (counts[plan.CREATE], counts[plan.UPDATE], counts[plan.NONE]))
+        return entries
+
+    def invalidate_index(self, resource=None):
+        '''Drop indexed names, use when resources change outside the client'''
+        utils.name_index.invalidate(resource=resource)
+
+    def __worker_clients(self, local):
+        # Each export worker thread authenticates its own clients
+        bundle = getattr(local, 'bundle', None)
+        if bundle is None:
+            bundle = local.bundle = ClientBundle(self.os_username,
+                                                 self.os_password,
+                                                 self.os_tenant_name,
+                                                 self.os_auth_url,
+                                                 token_cache=self.pool.token_cache,
+                                                 http=self.pool.http)
+        return bundle
+
+    def __export_tenant(self, clients, tenant, groups, temp):
+        with tracer.span('export tenant %s' % tenant.name, 'stage'):
+            return self.__export_tenant_data(clients, tenant, groups, temp)
+
+    def __export_tenant_data(self, clients, tenant, groups, temp):
+        tenant_data = []
+        tenant_data += [os_nova.save_quotas(clients.nova, tenant)]
+        tenant_data += [os_cinder.save_quotas(clients.cinder, tenant)]
+        if groups is not None:
+            tenant_data += os_neutron.save_security_groups(groups, tenant)
+            return tenant_data
+        # set up temp user to get security groups
+        user, user_password, member_role = temp
+        clients.keystone.tenants.add_user(tenant.id, user.id, member_role.id)
+        try:
+            session = self.pool.http.password_session(user.name, user_password,
+                                                      tenant.name,
+                                                      self.os_auth_url)
+            nova = nova_v1.Client(user.name, user_password,
+                                  tenant.name, self.os_auth_url,
+                                  session=session)
+            tenant_data += os_nova.save_security_groups(nova, tenant)
+        finally:
+            clients.keystone.tenants.remove_user(tenant.id, user.id,
+                                                 member_role.id)
+        return tenant_data
+
+    def __export_tenants(self, tenants, concurrency, groups, temp=None):
+        if concurrency > 1:
+            local = threading.local()
+            export_tenant = lambda tenant: self.__export_tenant(
+                self.__worker_clients(local), tenant, groups, temp)
+            # map keeps the tenant order of a serial export
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for tenant_data in paging.window_map(executor, export_tenant,
+                                                     tenants, concurrency * 2):
+                    for record in tenant_data:
+                        yield record
+        else:
+            for tenant in tenants:
+                for record in self.__export_tenant(self, tenant, groups, temp):
+                    yield record
+
+    def __bulk_security_groups(self):
+        # Admin can list groups of every tenant at once from neutron
+        if not settings.EXPORT_BULK_SECURITY_GROUPS:
+            return None
+        try:
+            return os_neutron.security_groups_by_tenant(self.neutron)
+        except Exception as e: #pylint: disable=broad-except
+            log.info('Cannot list all security groups, using temp user:%s' % e)
+            return None
+
+    def iter_export_config(self, concurrency=None):
+        '''Yield export records as they are gathered'''
+        concurrency = concurrency or settings.EXPORT_CONCURRENCY
+        self.pool.http.ensure_size(concurrency)
         log.info("Gathering data to export")
-        export_data = PortationResults()
         log.info("Gathering keystone data")
-        export_data += os_keystone.save_users(self.keystone)
-        export_data += os_keystone.save_projects(self.keystone)
-        export_data += os_keystone.save_roles(self.keystone)
-        export_data += os_nova.save_flavors(self.nova)
+        # Stage spans include time the consumer takes with each record
+        with tracer.span('export keystone', 'stage'):
+            for record in os_keystone.save_keystone(self.keystone,
+                                                    concurrency=concurrency):
+                yield record
+        with tracer.span('export flavors', 'stage'):
+            for record in os_nova.save_flavors(self.nova):
+                yield record
         log.info("Saving quota & security group data")
+        tenants = [records.ProjectRecord.from_resource(t)
+                   for t in paging.paged(self.keystone.tenants.list)
+                   if t.name not in settings.EXPORT_SKIP_PROJECTS]
+        with tracer.span('export security groups', 'stage'):
+            groups = self.__bulk_security_groups()
+        if groups is not None:
+            for record in self.__export_tenants(tenants, concurrency, groups):
+                yield record
+            return
         member_role = utils.find_role(self.keystone, '_member_')
         with utils.temp_user(self.keystone) as (user, user_password):
-            for tenant in self.keystone.tenants.list():
-                if tenant.name in settings.EXPORT_SKIP_PROJECTS:
-                    continue
-                export_data += [os_nova.save_quotas(self.nova, tenant)]
-                export_data += [os_cinder.save_quotas(self.cinder, tenant)]
-                # set up temp user to get security groups
-                self.keystone.tenants.add_user(tenant.id, user.id, member_role.id)
-                nova = nova_v1.Client(user.name, user_password,
-                                      tenant.name, self.os_auth_url)
-                export_data += os_nova.save_security_groups(nova, tenant)
+            for record in self.__export_tenants(tenants, concurrency, None,
+                                                (user, user_password,
+                                                 member_role)):
+                yield record
+
+    def export_config(self, concurrency=None):
+        export_data = PortationResults()
+        export_data += self.iter_export_config(concurrency=concurrency)
         return export_data
 
-    def export_images(self, save_directory):
+    def __export_image(self, clients, image, save_directory):
+        with tracer.span('export image %s' % image.name, 'stage'):
+            return self.__export_image_data(clients, image, save_directory)
+
+    def __export_image_data(self, clients, image, save_directory):
+        image_data = os_glance.save_image_meta(clients.glance, clients.keystone,
+                                               image)
+        if save_directory:
+            # Images already saved with a matching checksum are skipped
+            os_glance.save_image_data(clients.glance, image, save_directory,
+                                      checksum=image_data['image'].get('checksum'))
+        return image_data
+
+    def iter_export_images(self, save_directory, concurrency=None):
+        '''Yield image records as they are gathered'''
+        concurrency = concurrency or settings.EXPORT_CONCURRENCY
+        self.pool.http.ensure_size(concurrency)
         if save_directory:
             save_directory = utils.check_directory(save_directory)
         log.info("Gathering image data and/or metadata")
-        export_data = PortationResults()
         # the glance client will not list all images for some reason, use nova
-        for image in self.nova.images.list():
-            export_data += [os_glance.save_image_meta(self.glance, self.keystone,
-                                                      image)]
-            if save_directory:
-                # TODO this should probably verify with checksums
-                # TODO once checksum is done, should check if image exists
-                # .. already
-                os_glance.save_image_data(self.glance, image, save_directory)
+        # .. pages after the first are fetched while images are exported
+        images = paging.prefetch(records.ImageRecord.from_resource(image)
+                                 for image in paging.paged(self.nova.images.list))
+        if concurrency > 1:
+            local = threading.local()
+            export_image = lambda image: self.__export_image(
+                self.__worker_clients(local), image, save_directory)
+            # Images are taken from the listing as workers free up
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for image_data in paging.window_map(executor, export_image,
+                                                    images, concurrency * 2):
+                    yield image_data
+        else:
+            for image in images:
+                yield self.__export_image(self, image, save_directory)
+
+    def export_images(self, save_directory, concurrency=None):
+        export_data = PortationResults()
+        export_data += self.iter_export_images(save_directory,
+                                               concurrency=concurrency)
         return export_data
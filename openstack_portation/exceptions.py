@@ -1,2 +1,13 @@
+from jsonschema import ValidationError
+
 class OpenStackPortationError(Exception):
     pass
+
+class ConfigValidationError(OpenStackPortationError, ValidationError):
+    '''All schema errors of a config, still caught as a ValidationError'''
+    def __init__(self, errors):
+        # errors is list of (action index, message)
+        self.errors = errors
+        message = '%s schema errors:\n' % len(errors)
+        message += '\n'.join('action %s: %s' % error for error in errors)
+        ValidationError.__init__(self, message)
@@ -0,0 +1,60 @@
+from openstack_portation import settings
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+class FingerprintStore(object):
+    '''SQLite store of section fingerprints and the results they imported
+
+    A fingerprint is the hash of a section spec and the credentials it was
+    imported with, a section with a stored fingerprint whose resource still
+    exists does not need to be imported again.
+    '''
+    def __init__(self, path=settings.FINGERPRINT_CACHE_FILE):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        # Results are recorded from import worker threads
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                             'auth_url TEXT, section TEXT, hash TEXT, '
+                             'result TEXT, verified REAL, '
+                             'PRIMARY KEY (auth_url, section, hash))')
+
+    def get(self, auth_url, section, spec_hash):
+        '''Return result stored for fingerprint, None if not stored'''
+        with self._lock:
+            row = self._db.execute('SELECT result FROM fingerprints WHERE '
+                                   'auth_url=? AND section=? AND hash=?',
+                                   (auth_url, section, spec_hash)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, auth_url, section, spec_hash, result):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO fingerprints VALUES '
+                             '(?, ?, ?, ?, ?)',
+                             (auth_url, section, spec_hash,
+                              json.dumps(result, sort_keys=True), time.time()))
+
+    def verified(self, keys):
+        '''Mark list of (auth_url, section, hash) as found to exist now'''
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany('UPDATE fingerprints SET verified=? WHERE '
+                                 'auth_url=? AND section=? AND hash=?',
+                                 [(now,) + tuple(key) for key in keys])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
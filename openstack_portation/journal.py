@@ -0,0 +1,74 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+def action_hash(action):
+    '''Return hash of action spec, same for equal actions in any key order'''
+    spec = json.dumps(action, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()
+
+class Journal(object):
+    '''Append only file of completed actions, used to resume an import
+
+    Each line is the index of an action, the hash of its spec and its
+    results. Lines are synced to disk as actions complete, a line cut short
+    by a crash is ignored when the journal is loaded.
+    '''
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = {}
+        if resume:
+            self.entries = self.load(path)
+            log.info('Loaded %s completed actions from journal:%s' %
+                     (len(self.entries), path))
+        self._file = open(path, 'a' if resume else 'w')
+        self._lock = threading.Lock()
+        if resume and self._ends_cut_short(path):
+            # Start a new line after a line cut short by a crash
+            self._file.write('\n')
+
+    @staticmethod
+    def _ends_cut_short(path):
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if not f.tell():
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+
+    @staticmethod
+    def load(path):
+        entries = {}
+        if not os.path.isfile(path):
+            return entries
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry['index']] = entry
+        return entries
+
+    def completed(self, index, spec_hash):
+        '''Return results of action if it completed with the same spec'''
+        entry = self.entries.get(index)
+        if entry is None or entry['hash'] != spec_hash:
+            return None
+        return entry['results']
+
+    def commit(self, index, spec_hash, results):
+        entry = {'index' : index, 'hash' : spec_hash, 'results' : results}
+        with self._lock:
+            self._file.write(json.dumps(entry, sort_keys=True) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.entries[index] = entry
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,124 @@
+from openstack_portation.trace import tracer
+
+import json
+import logging
+import re
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Path segments that are resource ids, replaced so calls group by operation
+ID_PATTERN = re.compile(r'^([0-9a-fA-F-]{32,36}|[0-9a-fA-F]{16,}|[0-9]+)$')
+
+def _percentile(values, percent):
+    # Nearest rank on sorted values
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+def operation_name(method, path):
+    segments = ['{id}' if ID_PATTERN.match(s) else s
+                for s in path.split('?')[0].split('/') if s]
+    return '%s /%s' % (method, '/'.join(segments))
+
+class ApiMetrics(object):
+    '''Latency, bytes and status of each API call, grouped by operation'''
+    def __init__(self):
+        self._calls = {}
+        self._endpoints = []
+        self._lock = threading.Lock()
+
+    def register_endpoint(self, url, service):
+        '''Calls to urls under endpoint are recorded for service'''
+        if not url:
+            return
+        url = url.rstrip('/')
+        with self._lock:
+            if (url, service) in self._endpoints:
+                return
+            self._endpoints.append((url, service))
+            # Longest endpoint matched first
+            self._endpoints.sort(key=lambda e: len(e[0]), reverse=True)
+
+    def service(self, url):
+        '''Return service url was sent to'''
+        with self._lock:
+            return self._service(url)[0]
+
+    def _service(self, url):
+        for endpoint, service in self._endpoints:
+            if url.startswith(endpoint):
+                return service, url[len(endpoint):]
+        # Endpoint of other tenant, service still known from host
+        host, _, path = url.split('://', 1)[-1].partition('/')
+        for endpoint, service in self._endpoints:
+            if endpoint.split('://', 1)[-1].partition('/')[0] == host:
+                return service, path
+        return 'unknown', path
+
+    def record(self, method, url, latency, size, status):
+        with self._lock:
+            service, path = self._service(url)
+            key = (service, operation_name(method, path))
+        # Call ended now, nested under the span that made it
+        tracer.add(key[1], service, time.time() - latency, latency,
+                   {'status' : status, 'bytes' : size})
+        with self._lock:
+            calls = self._calls.setdefault(key, {'latency' : [], 'bytes' : 0,
+                                                 'errors' : 0})
+            calls['latency'].append(latency)
+            calls['bytes'] += size
+            if status >= 400:
+                calls['errors'] += 1
+
+    def response_hook(self, response, *args, **kwargs): #pylint: disable=unused-argument
+        '''requests response hook, records the call made'''
+        request = response.request
+        # Content length header, streamed bodies are not read here
+        size = int(response.headers.get('Content-Length') or 0)
+        self.record(request.method, request.url,
+                    response.elapsed.total_seconds(), size,
+                    response.status_code)
+        return response
+
+    def summary(self):
+        '''Return list of per operation stats, slowest total time first'''
+        rows = []
+        with self._lock:
+            for (service, operation), calls in self._calls.items():
+                latency = sorted(calls['latency'])
+                rows.append({
+                    'service' : service,
+                    'operation' : operation,
+                    'count' : len(latency),
+                    'errors' : calls['errors'],
+                    'bytes' : calls['bytes'],
+                    'p50' : _percentile(latency, 50),
+                    'p95' : _percentile(latency, 95),
+                    'max' : latency[-1],
+                    'total' : sum(latency),
+                })
+        rows.sort(key=lambda r: r['total'], reverse=True)
+        return rows
+
+    def report(self):
+        '''Return summary as a text table'''
+        header = '%-10s %-45s %6s %6s %8s %8s %8s %9s' % (
+            'service', 'operation', 'count', 'errors',
+            'p50', 'p95', 'max', 'total')
+        lines = [header]
+        for row in self.summary():
+            lines.append('%-10s %-45s %6d %6d %8.3f %8.3f %8.3f %9.3f' % (
+                row['service'], row['operation'][:45], row['count'],
+                row['errors'], row['p50'], row['p95'], row['max'],
+                row['total']))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        log.debug('Writing API metrics to file:%s' % path)
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=4, sort_keys=True)
+
+    def reset(self):
+        with self._lock:
+            self._calls = {}
@@ -1,4 +1,6 @@
+from openstack_portation import paging
 from openstack_portation import settings
+from openstack_portation import records
 from openstack_portation import utils
 from openstack_portation.exceptions import OpenStackPortationError
 
@@ -12,10 +14,20 @@ def set_cinder_quota(cinder, keystone, **args):
     project = utils.find_project(keystone, tenant_name)
     if not project:
         raise OpenStackPortationError("Cannot find project:%s" % tenant_name)
-    cinder.quotas.update(project.id, **args)
+    changes = utils.changed_fields(cinder.quotas.get(project.id), args)
+    if not changes:
+        log.info("Cinder quotas unchanged for project:%s" % project.id)
+        return {'cinder_quota' : project.id}
+    cinder.quotas.update(project.id, **dict((k, args[k]) for k in changes))
     log.info("Updated cinder quotas for project:%s" % project.id)
     return {'cinder_quota' : project.id}
 
+def plan_cinder_quota(cinder, keystone, **args):
+    project = utils.find_project(keystone, args.pop('tenant_name', None))
+    if not project:
+        return 'update', utils.changed_fields({}, args)
+    return 'update', utils.changed_fields(cinder.quotas.get(project.id), args)
+
 def create_volume(cinder, nova, **args):
     log.debug('Create volume:%s' % args)
     name = args.pop('name', None)
@@ -35,17 +47,30 @@ def create_volume(cinder, nova, **args):
     else:
         volume = cinder.volumes.create(**args)
         log.info('Volume created:%s' % volume.id)
+        utils.name_index.add(cinder, 'volume', name, volume)
     if wait:
         log.info('Waiting for volume:%s, timeout:%s' % (volume.id, timeout))
         utils.wait_status(cinder.volumes.get, volume.id,
                           ['available'], ['error'], interval, timeout)
     return {'volume' : volume.id}
 
+def plan_volume(cinder, **args):
+    if not utils.find_volume(cinder, args.get('name')):
+        return 'create', {}
+    return 'update', {}
+
+def volume_lister(cinder):
+    '''Return function getting volumes, or listing all when many are waited on'''
+    def lister(obj_ids):
+        if len(obj_ids) <= settings.WAIT_GET_MAX:
+            return [cinder.volumes.get(obj_id) for obj_id in obj_ids]
+        wanted = set(obj_ids)
+        return [volume for volume in paging.paged_search(cinder.volumes.list)
+                if volume.id in wanted]
+    return lister
+
 def save_quotas(cinder, tenant):
     quotas = cinder.quotas.get(tenant.id)
-    quota_args = vars(quotas)
-    for key in quota_args.keys():
-        if key in settings.EXPORT_KEYS_IGNORE:
-            quota_args.pop(key)
+    quota_args = records.CinderQuotaRecord.from_resource(quotas).as_dict()
     quota_args['tenant_name'] = str(tenant.name)
     return {'cinder_quota' : quota_args}
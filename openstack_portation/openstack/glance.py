@@ -1,11 +1,20 @@
+from openstack_portation import records
 from openstack_portation import settings
 from openstack_portation import utils
+from openstack_portation.exceptions import OpenStackPortationError
 
+import hashlib
 import logging
 import os
 
 log = logging.getLogger(__name__)
 
+def _image_changes(image, args):
+    fields = dict(args)
+    # image data is only set when created
+    fields.pop('copy_from', None)
+    return utils.changed_fields(image, fields)
+
 def create_image(glance, **args):
     log.debug('Creating image:%s' % args)
     wait = args.pop('wait', settings.IMAGE_WAIT)
@@ -14,15 +23,22 @@ def create_image(glance, **args):
     # By default use glance that already exists
     image_name = args.get('name', None)
     file_location = args.pop('file', None)
-    image = utils.find_image(glance, image_name)
+    image = utils.find_glance_image(glance, image_name)
     if image:
         # update image data
-        args.pop('copy_from', None)
-        glance.images.update(image.id, **args)
-        log.info('Updated image:%s' % image.id)
+        changes = _image_changes(image, args)
+        if changes:
+            glance.images.update(image.id,
+                                 **dict((k, args[k]) for k in changes))
+            log.info('Updated image:%s' % image.id)
+        else:
+            log.info('Image unchanged:%s' % image.id)
     else:
         image = glance.images.create(**args)
         log.info('Created image:%s' % image.id)
+        utils.name_index.add(glance, 'glance_image', image.name, image)
+        # nova lists images again to find the new one
+        utils.name_index.invalidate('image', glance)
         if file_location:
             log.info('Updating data for image:%s' % image.id)
             image.update(data=open(file_location, 'rb'))
@@ -32,22 +48,59 @@ def create_image(glance, **args):
                           ['error'], interval, timeout)
     return {'image' : image.id}
 
+def plan_image(glance, **args):
+    for key in ['wait', 'timeout', 'wait_interval', 'file']:
+        args.pop(key, None)
+    image = utils.find_glance_image(glance, args.get('name'))
+    if not image:
+        return 'create', {}
+    return 'update', _image_changes(image, args)
+
+def image_lister(glance):
+    '''Return function getting each image, listing would cover every image
+    visible to the tenant, public ones too'''
+    return lambda obj_ids: [glance.images.get(obj_id) for obj_id in obj_ids]
+
 def save_image_meta(glance, keystone, image):
     log.info("Saving image:%s metadata" % image.id)
     image = glance.images.get(image.id)
-    image_dict = vars(image)
-    for key in settings.EXPORT_KEYS_IGNORE:
-        image_dict.pop(key, None)
+    image_dict = records.ImageRecord.from_resource(image).as_dict()
     # identify owner as tenant id
     owner = '%s' % image_dict.pop('owner')
     tenant = keystone.tenants.get(owner)
     image_dict['tenant_name'] = tenant.name
     return {'image' : image_dict}
 
-def save_image_data(glance, image, save_directory):
-    log.info("Saving image:%s data to dir:%s" % (image.id, save_directory))
+def file_checksum(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as read_file:
+        for chunk in iter(lambda: read_file.read(settings.IMAGE_CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def save_image_data(glance, image, save_directory, checksum=None):
     image_name = 'image-%s-%s' % (image.name, image.id)
     image_path = os.path.join(save_directory, image_name)
-    with open(image_path, 'wb') as write_file:
+    if checksum is None:
+        # nova image objects do not carry the checksum
+        checksum = glance.images.get(image.id).checksum
+    if os.path.isfile(image_path) and checksum and \
+            file_checksum(image_path) == checksum:
+        log.info("Image:%s data already saved:%s" % (image.id, image_path))
+        return image_path
+    log.info("Saving image:%s data to dir:%s" % (image.id, save_directory))
+    # Write to temp file first so partial downloads are never mistaken
+    # .. for saved images when resuming an export
+    temp_path = '%s.part' % image_path
+    md5 = hashlib.md5()
+    with open(temp_path, 'wb') as write_file:
         for chunk in glance.images.data(image.id):
+            md5.update(chunk)
             write_file.write(chunk)
+    if checksum and md5.hexdigest() != checksum:
+        os.remove(temp_path)
+        raise OpenStackPortationError('Checksum mismatch for image:%s, '
+                                      'expected:%s got:%s' %
+                                      (image.id, checksum, md5.hexdigest()))
+    os.rename(temp_path, image_path)
+    return image_path
@@ -1,99 +1,296 @@
+from openstack_portation import paging
+from openstack_portation import records
 from openstack_portation import settings
 from openstack_portation import utils
+from openstack_portation.exceptions import OpenStackPortationError
 
+from keystoneclient import discover
 from keystoneclient.openstack.common.apiclient import exceptions as keystone_exceptions
+from keystoneclient.v3 import client as key_v3
 
+from concurrent.futures import ThreadPoolExecutor
+import collections
 import logging
+import threading
+import urlparse
 
 log = logging.getLogger(__name__)
 
+def _user_changes(user, kwargs):
+    fields = dict(kwargs)
+    password = fields.pop('password', None)
+    reset_password = fields.pop('reset_password',
+                                settings.USER_RESET_PASSWORD)
+    changes = utils.changed_fields(user, fields)
+    # Passwords cannot be read back, only set when asked to
+    if password and reset_password:
+        changes['password'] = ('***', '***')
+    return changes
+
+def _update_user(keystone, user, **kwargs):
+    changes = _user_changes(user, kwargs)
+    # Password is a seperate function
+    if changes.pop('password', None):
+        keystone.users.update_password(user.id, kwargs['password'])
+        log.info("Updated password of user:%s" % user.id)
+    if changes:
+        user = keystone.users.update(user.id, **dict((k, kwargs[k])
+                                                     for k in changes))
+        log.info("Updated user:%s" % user.id)
+        utils.name_index.add(keystone, 'user', user.name, user)
+    else:
+        log.info("User unchanged:%s" % user.id)
+    return user
+
 def create_user(keystone, **kwargs):
     log.debug('Creating user:%s' % kwargs)
+    reset_password = kwargs.pop('reset_password',
+                                settings.USER_RESET_PASSWORD)
+    user = utils.find_user(keystone, kwargs['name'])
+    if user:
+        log.debug("User with name already exists:%s" % user)
+        user = _update_user(keystone, user, reset_password=reset_password,
+                            **kwargs)
+        return {'user' : user.id}
     try:
         user = keystone.users.create(**kwargs)
         log.info('User created:%s' % user)
+        utils.name_index.add(keystone, 'user', user.name, user)
     except keystone_exceptions.Forbidden as error:
         log.error('Admin credentials required for user creation:%s' % str(error))
         return None
     except keystone_exceptions.Conflict:
-        # User allready exists
+        # User created since it was indexed
+        utils.name_index.invalidate('user', keystone)
         user = utils.find_user(keystone, kwargs['name'])
         log.debug("User with name already exists:%s" % user)
-        # Update data with whats in args
-        # Password is a seperate function
-        password = kwargs.pop('password', None)
-        if password:
-            keystone.users.update_password(user.id, password)
-        user = keystone.users.update(user.id, **kwargs)
-        log.info("Updated user:%s" % user.id)
+        user = _update_user(keystone, user, reset_password=reset_password,
+                            **kwargs)
     return {'user' : user.id}
 
+def plan_user(keystone, **kwargs):
+    user = utils.find_user(keystone, kwargs['name'])
+    if not user:
+        return 'create', {}
+    changes = _user_changes(user, kwargs)
+    # Passwords cannot be compared, the plan does not guess
+    changes.pop('password', None)
+    return 'update', changes
+
+def _project_changes(project, kwargs):
+    fields = dict(kwargs)
+    fields.pop('tenant_name', None)
+    return utils.changed_fields(project, fields)
+
+def _needs_role(keystone, project, user, role):
+    roles = keystone.users.list_roles(user.id, tenant=project.id)
+    return role.id not in [r.id for r in roles]
+
 def create_project(keystone, **kwargs):
     log.debug('Creating project:%s' % kwargs)
     role = utils.find_role(keystone, kwargs.pop('role', None))
     kwargs['tenant_name'] = kwargs.pop('name', None)
     user = utils.find_user(keystone, kwargs.pop('user', None))
 
-    try:
-        project = keystone.tenants.create(**kwargs)
-        log.info('Project created:%s' % project.id)
-    except keystone_exceptions.Conflict:
-        project = utils.find_project(keystone, kwargs['tenant_name'] or None)
+    project = utils.find_project(keystone, kwargs['tenant_name'])
+    if not project:
+        try:
+            project = keystone.tenants.create(**kwargs)
+            log.info('Project created:%s' % project.id)
+        except keystone_exceptions.Conflict:
+            # Project created since it was indexed
+            utils.name_index.invalidate('project', keystone)
+            project = utils.find_project(keystone, kwargs['tenant_name'])
+            log.debug('Project already exists:%s' % project.id)
+    else:
         log.debug('Project already exists:%s' % project.id)
+    if _project_changes(project, kwargs):
         # Update data with whats in args
         project = keystone.tenants.update(project.id, **kwargs)
         log.info("Project updated:%s" % project.id)
+    utils.name_index.add(keystone, 'project', project.name, project)
     if user and role:
-        try:
+        if _needs_role(keystone, project, user, role):
             project.add_user(user.id, role.id)
             log.info('Added user:%s to project:%s with role:%s' %
                      (user.id, project.id, role.id))
-        except keystone_exceptions.Conflict:
-            # Role already exists
+        else:
             log.info('Role exits user:%s to project:%s with role:%s' %
                      (user.id, project.id, role.id))
     return {'project' : project.id}
 
+def plan_project(keystone, **kwargs):
+    role_name = kwargs.pop('role', None)
+    user_name = kwargs.pop('user', None)
+    name = kwargs.pop('name', None)
+    project = utils.find_project(keystone, name)
+    if not project:
+        action, changes = 'create', {}
+    else:
+        action, changes = 'update', _project_changes(project, kwargs)
+    if user_name and role_name:
+        role = utils.find_role(keystone, role_name)
+        user = utils.find_user(keystone, user_name)
+        if not project or not user or not role or \
+                _needs_role(keystone, project, user, role):
+            changes['role'] = (None, '%s:%s' % (user_name, role_name))
+    return action, changes
+
+def _user_record(user):
+    user_data = user.as_dict()
+    log.debug('Saving user data:%s' % user_data)
+    return {'user' : utils.pretty_dict(user_data)}
+
+def _project_record(project):
+    project_data = project.as_dict()
+    log.debug('Saving project data:%s' % project_data)
+    return {'project' : utils.pretty_dict(project_data)}
+
+def _role_record(project_name, user_name, role_name):
+    data = dict()
+    data['name'] = project_name
+    data['user'] = user_name
+    data['role'] = role_name
+    data = utils.pretty_dict(data)
+    log.debug("Saving role data:%s" % data)
+    return {'project' : data}
+
 def save_users(keystone):
     log.info('Saving all user data')
-    return_data = []
-    for user in keystone.users.list():
+    for user in paging.prefetch(paging.paged(keystone.users.list)):
         if user.name in settings.EXPORT_SKIP_USERS:
             continue
-        user_data = vars(user)
-        ignore_keys = settings.EXPORT_KEYS_IGNORE + ['tenantId', 'username']
-        for key in ignore_keys:
-            user_data.pop(key, None)
-        log.debug('Saving user data:%s' % user_data)
-        return_data.append({'user' : utils.pretty_dict(user_data)})
-    return return_data
+        yield _user_record(records.UserRecord.from_resource(user))
 
 def save_projects(keystone):
     log.info('Saving all project data')
-    return_data = []
-    for project in keystone.tenants.list():
+    for project in paging.prefetch(paging.paged(keystone.tenants.list)):
         if project.name in settings.EXPORT_SKIP_PROJECTS:
             continue
-        project_data = vars(project)
-        for key in settings.EXPORT_KEYS_IGNORE:
-            project_data.pop(key, None)
-        log.debug('Saving project data:%s' % project_data)
-        return_data.append({'project' : utils.pretty_dict(project_data)})
-    return return_data
+        yield _project_record(records.ProjectRecord.from_resource(project))
 
 def save_roles(keystone):
     log.info('Saving all role data')
-    return_data = []
-    for project in keystone.tenants.list():
+    for project in paging.paged(keystone.tenants.list):
         if project.name in settings.EXPORT_SKIP_PROJECTS:
             continue
         for user in keystone.tenants.list_users(project.id):
             for role in keystone.users.list_roles(user.id, tenant=project.id):
-                data = dict()
-                data['name'] = project.name
-                data['user'] = user.name
-                data['role'] = role.name
-                data = utils.pretty_dict(data)
-                log.debug("Saving role data:%s" % data)
-                return_data.append({'project' : data})
-    return return_data
+                yield _role_record(project.name, user.name, role.name)
+
+def _v3_endpoint(keystone):
+    # Version discovery at the root of the identity endpoint
+    url = urlparse.urlparse(keystone.management_url)
+    root = '%s://%s/' % (url.scheme, url.netloc)
+    endpoint = discover.Discover(session=keystone.session,
+                                 auth_url=root).url_for('3.0')
+    if not endpoint:
+        raise OpenStackPortationError('No v3 identity endpoint at:%s' % root)
+    return endpoint
+
+def _counted(function, counter, lock):
+    # Count every call, paged listings call once per page
+    def call(*args, **kwargs):
+        with lock:
+            counter['calls'] += 1
+        return function(*args, **kwargs)
+    return call
+
+def _v3_assignments(keystone, users, roles, count):
+    # One call returns every role assignment, members are ordered as users
+    # .. are listed and their roles as roles are listed
+    # Version discovery, then the listing
+    count()
+    v3 = key_v3.Client(token=keystone.auth_token,
+                       endpoint=_v3_endpoint(keystone))
+    count()
+    user_order = dict((user_id, i) for i, user_id in enumerate(users))
+    role_order = dict((role_id, i) for i, role_id in enumerate(roles))
+    assignments = {}
+    for assignment in v3.role_assignments.list():
+        user = getattr(assignment, 'user', None)
+        project = getattr(assignment, 'scope', {}).get('project')
+        if not user or not project or user['id'] not in users:
+            continue
+        role_ids = assignments.setdefault(project['id'], {}).setdefault(
+            user['id'], set())
+        role_ids.add(assignment.role['id'])
+    ordered = {}
+    for tenant_id, members in assignments.items():
+        ordered[tenant_id] = [
+            (users[user_id], [roles[role_id] for role_id in
+                              sorted(members[user_id], key=role_order.get)])
+            for user_id in sorted(members, key=user_order.get)]
+    return ordered
+
+def _v2_assignments(keystone, tenants, count, concurrency):
+    # Fan out membership and role queries over worker pool, members and
+    # .. roles keep the order save_roles lists them in
+    def list_members(tenant):
+        count()
+        return tenant.id, [(u.id, u.name)
+                           for u in keystone.tenants.list_users(tenant.id)]
+    def list_roles(member):
+        tenant_id, user_id, _ = member
+        count()
+        roles = keystone.users.list_roles(user_id, tenant=tenant_id)
+        return [r.name for r in roles]
+    assignments = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        members = []
+        for tenant_id, users in executor.map(list_members, tenants):
+            members += [(tenant_id, user_id, user_name)
+                        for user_id, user_name in users]
+        for member, role_names in zip(members,
+                                      executor.map(list_roles, members)):
+            tenant_id, _, user_name = member
+            assignments.setdefault(tenant_id, []).append((user_name,
+                                                          role_names))
+    return assignments
+
+def save_keystone(keystone, concurrency=1):
+    '''Yield user, project and role records from one snapshot of keystone
+
+    Same user and project records in the same order as save_users and
+    save_projects. With EXPORT_V3_ROLE_ASSIGNMENTS roles come from one v3
+    listing, members ordered as users are listed and their roles as roles
+    are listed. Without it, or without a v3 endpoint, roles are the records
+    of save_roles in its order.
+    '''
+    log.info('Saving all keystone data')
+    counter = {'calls' : 0}
+    lock = threading.Lock()
+    # Counts calls made through clients that are not wrapped
+    count = _counted(lambda: None, counter, lock)
+    # Users are written as their pages arrive, only ids and names are kept
+    user_names = collections.OrderedDict()
+    users = _counted(keystone.users.list, counter, lock)
+    for user in paging.prefetch(paging.paged(users)):
+        user_names[user.id] = user.name
+        if user.name not in settings.EXPORT_SKIP_USERS:
+            yield _user_record(records.UserRecord.from_resource(user))
+    # Projects are kept for the role pass, as records of their fields
+    tenants = _counted(keystone.tenants.list, counter, lock)
+    tenants = [records.ProjectRecord.from_resource(t)
+               for t in paging.paged(tenants)
+               if t.name not in settings.EXPORT_SKIP_PROJECTS]
+    for project in tenants:
+        yield _project_record(project)
+    assignments = None
+    if settings.EXPORT_V3_ROLE_ASSIGNMENTS:
+        count()
+        role_names = collections.OrderedDict((r.id, r.name)
+                                             for r in keystone.roles.list())
+        try:
+            assignments = _v3_assignments(keystone, user_names, role_names,
+                                          count)
+        except Exception as e: #pylint: disable=broad-except
+            log.debug('Cannot list v3 role assignments, using v2:%s' % e)
+    if assignments is None:
+        assignments = _v2_assignments(keystone, tenants, count, concurrency)
+    for project in tenants:
+        for user_name, role_names in assignments.get(project.id, []):
+            for role_name in role_names:
+                yield _role_record(project.name, user_name, role_name)
+    log.info('Keystone export made %s API calls for %s projects' %
+             (counter['calls'], len(tenants)))
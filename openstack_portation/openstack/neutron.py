@@ -1,3 +1,6 @@
+from openstack_portation import paging
+from openstack_portation import records
+from openstack_portation import settings
 from openstack_portation import utils
 
 from neutronclient.common import exceptions as neutron_exceptions
@@ -6,8 +9,13 @@ import logging
 
 log = logging.getLogger(__name__)
 
-def create_network(neutron, keystone, **args):
-    log.debug('Creating network:%s' % args)
+def _created(neutron, resource, obj):
+    log.info('Created %s:%s' % (resource, obj['id']))
+    utils.name_index.add(neutron, resource, obj['name'], obj)
+    return {resource : obj['id']}
+
+def _network_body(neutron, keystone, args):
+    # Return args to create network with, None if it already exists
     tenant = utils.find_project(keystone,
                                 args.pop('tenant_name', None))
     if not tenant:
@@ -17,15 +25,24 @@ def create_network(neutron, keystone, **args):
     net = utils.find_network(neutron, args['name'], tenant_id)
     if net:
         log.info('Network already exists:%s' % net['id'])
-        return
+        return None
     if tenant:
         args['tenant_id'] = tenant.id
-    network = neutron.create_network({'network' : args})
-    log.info('Created network:%s' % network['network']['id'])
-    return {'network' : network['network']['id']}
+    return args
 
-def create_subnet(neutron, keystone, **args):
-    log.debug('Creating subnet:%s' % args)
+def _post_network(neutron, body):
+    network = neutron.create_network({'network' : body})
+    return _created(neutron, 'network', network['network'])
+
+def create_network(neutron, keystone, **args):
+    log.debug('Creating network:%s' % args)
+    body = _network_body(neutron, keystone, args)
+    if body is None:
+        return
+    return _post_network(neutron, body)
+
+def _subnet_body(neutron, keystone, args):
+    # Return args to create subnet with, None if it already exists
     tenant = utils.find_project(keystone,
                                 args.pop('tenant_name', None))
     if not tenant:
@@ -37,16 +54,101 @@ def create_subnet(neutron, keystone, **args):
     sub = utils.find_subnet(neutron, args['name'], tenant_id, network['id'])
     if sub:
         log.info('Subnet already exists:%s' % sub['id'])
-        return
+        return None
     if tenant:
         args['tenant_id'] = tenant.id
+    return args
+
+def _post_subnet(neutron, body):
     try:
-        subnet = neutron.create_subnet({"subnet" : args})
+        subnet = neutron.create_subnet({"subnet" : body})
     except neutron_exceptions.BadRequest as e:
         log.error('Cannot create subnet:%s' % str(e))
         return
-    log.info('Created subnet:%s' % subnet['subnet']['id'])
-    return {'subnet' : subnet['subnet']['id']}
+    return _created(neutron, 'subnet', subnet['subnet'])
+
+def create_subnet(neutron, keystone, **args):
+    log.debug('Creating subnet:%s' % args)
+    body = _subnet_body(neutron, keystone, args)
+    if body is None:
+        return
+    return _post_subnet(neutron, body)
+
+def _bulk_post(neutron, resource, bodies, post_one):
+    # Neutron bulk create is all or nothing, failed chunks are retried
+    # .. one at a time so only the bad items fail
+    plural = resource + 's'
+    create = getattr(neutron, 'create_%s' % resource)
+    size = settings.NEUTRON_BULK_SIZE
+    results = []
+    for start in range(0, len(bodies), size):
+        chunk = bodies[start:start + size]
+        try:
+            created = create({plural : chunk})[plural]
+        except neutron_exceptions.NeutronClientException as e:
+            log.info('Bulk create of %s %s failed, creating one at a time:%s' %
+                     (len(chunk), plural, str(e)))
+            results += [post_one(neutron, body) for body in chunk]
+            continue
+        log.info('Bulk created %s %s' % (len(created), plural))
+        # Neutron returns resources in request order
+        results += [_created(neutron, resource, obj) for obj in created]
+    return results
+
+def _bulk_create(neutron, keystone, resource, sections, body_function,
+                 post_one):
+    results = [None] * len(sections)
+    pending = []
+    seen = set()
+    for index, args in enumerate(sections):
+        log.debug('Creating %s:%s' % (resource, args))
+        body = body_function(neutron, keystone, dict(args))
+        if body is None:
+            continue
+        # A later section with the same name would find the first one
+        key = (body['name'], body.get('tenant_id'), body.get('network_id'))
+        if key in seen:
+            log.info('%s already in bulk request:%s' % (resource.capitalize(),
+                                                        body['name']))
+            continue
+        seen.add(key)
+        pending.append((index, body))
+    created = _bulk_post(neutron, resource, [body for _, body in pending],
+                         post_one)
+    for (index, _), result in zip(pending, created):
+        results[index] = result
+    return results
+
+def plan_network(neutron, keystone, **args):
+    if _network_body(neutron, keystone, args) is None:
+        return 'update', {}
+    return 'create', {}
+
+def plan_subnet(neutron, keystone, **args):
+    tenant = utils.find_project(keystone, args.get('tenant_name'))
+    if not utils.find_network(neutron, args.get('network'),
+                              tenant.id if tenant else None):
+        # Network is created by an earlier section
+        return 'create', {}
+    if _subnet_body(neutron, keystone, args) is None:
+        return 'update', {}
+    return 'create', {}
+
+def create_networks(neutron, keystone, sections):
+    '''Create networks of many sections with bulk requests
+
+    Returns the result create_network would give for each section, in order.
+    '''
+    return _bulk_create(neutron, keystone, 'network', sections,
+                        _network_body, _post_network)
+
+def create_subnets(neutron, keystone, sections):
+    '''Create subnets of many sections with bulk requests
+
+    Returns the result create_subnet would give for each section, in order.
+    '''
+    return _bulk_create(neutron, keystone, 'subnet', sections,
+                        _subnet_body, _post_subnet)
 
 def create_router(neutron, keystone, **args):
     log.debug('Create router:%s' % args)
@@ -62,9 +164,13 @@ def create_router(neutron, keystone, **args):
                                  None, None)
     if router:
         log.info('Router already exists:%s' % router['id'])
+        changes = _router_changes(neutron, router, external, internal)
+        external = external if 'external_network' in changes else None
+        internal = internal if 'internal_subnet' in changes else None
     else:
         router = neutron.create_router({'router' : args})['router']
         log.info('Created router:%s' % router['id'])
+        utils.name_index.add(neutron, 'router', router['name'], router)
 
     if external:
         data = {'network_id' : external['id']}
@@ -81,3 +187,73 @@ def create_router(neutron, keystone, **args):
         except neutron_exceptions.BadRequest as e:
             log.error('Cannot add internal subnet:%s' % str(e))
     return {'router' : router['id']}
+
+def _router_changes(neutron, router, external, internal):
+    # Gateway and interface of router that are not set yet
+    changes = {}
+    if external:
+        router_data = neutron.show_router(router['id'])['router']
+        gateway = router_data.get('external_gateway_info') or {}
+        if gateway.get('network_id') != external['id']:
+            changes['external_network'] = (gateway.get('network_id'),
+                                           external['id'])
+    if internal:
+        ports = neutron.list_ports(device_id=router['id'],
+                                   fields=['fixed_ips'])['ports']
+        subnet_ids = [ip['subnet_id'] for port in ports
+                      for ip in port['fixed_ips']]
+        if internal['id'] not in subnet_ids:
+            changes['internal_subnet'] = (None, internal['id'])
+    return changes
+
+def plan_router(neutron, keystone, **args): #pylint: disable=unused-argument
+    router = utils.find_router(neutron, args['name'], None)
+    if not router:
+        return 'create', {}
+    external = utils.find_network(neutron, args.get('external_network'), None)
+    internal = utils.find_subnet(neutron, args.get('internal_subnet'),
+                                 None, None)
+    return 'update', _router_changes(neutron, router, external, internal)
+
+def _nova_rule(rule):
+    # Same fields nova reports for rules of neutron security groups
+    protocol = rule['protocol']
+    from_port = rule['port_range_min']
+    to_port = rule['port_range_max']
+    if protocol and from_port is None and to_port is None:
+        if protocol.upper() in ['TCP', 'UDP']:
+            from_port, to_port = 1, 65535
+        else:
+            from_port, to_port = -1, -1
+    if rule['remote_group_id']:
+        cidr = None
+    else:
+        cidr = str(rule['remote_ip_prefix'] or '0.0.0.0/0')
+    return {
+        'ip_protocol' : str(protocol),
+        'from_port' : from_port,
+        'to_port' : to_port,
+        'cidr' : cidr,
+    }
+
+def security_groups_by_tenant(neutron):
+    '''Return security groups of all tenants in nova format, by tenant id'''
+    log.info('Listing security groups for all tenants')
+    groups = {}
+    for group in paging.paged_neutron(neutron.list_security_groups,
+                                      'security_group'):
+        # nova only shows ingress rules
+        rules = [records.RuleRecord(**_nova_rule(rule))
+                 for rule in group['security_group_rules']
+                 if rule['direction'] == 'ingress']
+        # Groups are kept for the whole export, as records of their fields
+        groups.setdefault(group['tenant_id'], []).append(
+            records.SecurityGroupRecord(name=str(group['name']),
+                                        description=str(group['description']),
+                                        rules=rules))
+    return groups
+
+def save_security_groups(groups, tenant):
+    for group in groups.get(tenant.id, []):
+        yield {'security_group' : group.as_dict(),
+               'os_tenant_name' : str(tenant.name)}
@@ -1,9 +1,13 @@
+from openstack_portation import paging
+from openstack_portation import records
 from openstack_portation import settings
 from openstack_portation import utils
 from openstack_portation.exceptions import OpenStackPortationError
 
 from novaclient import exceptions as nova_exceptions
 
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import logging
 
 log = logging.getLogger(__name__)
@@ -13,6 +17,7 @@ def create_flavor(nova, **kwargs):
     try:
         flavor = nova.flavors.create(**kwargs)
         log.info("Created flavor:%s" % flavor.id)
+        utils.name_index.add(nova, 'flavor', flavor.name, flavor)
         return {'flavor' : flavor.id}
     except nova_exceptions.Conflict:
         # Flavor already exists
@@ -20,22 +25,105 @@ def create_flavor(nova, **kwargs):
         log.info('Flavor already exists:%s' % flavor_id)
         return {'flavor' : flavor_id}
 
+def plan_flavor(nova, **kwargs):
+    if not utils.find_flavor(nova, kwargs.get('name')):
+        return 'create', {}
+    return 'update', {}
+
 def set_nova_quota(nova, keystone, **kwargs):
     log.debug('Setting nova quotas:%s' % kwargs)
     tenant_name = kwargs.pop('tenant_name', None)
     project = utils.find_project(keystone, tenant_name)
     if not project:
         raise OpenStackPortationError("Cannot find project:%s" % tenant_name)
+    changes = utils.changed_fields(nova.quotas.get(project.id), kwargs)
+    if not changes:
+        log.info("Quotas unchanged for project:%s" % project.id)
+        return {'nova_quota' : project.id}
     try:
-        nova.quotas.update(project.id, **kwargs)
+        nova.quotas.update(project.id, **dict((k, kwargs[k]) for k in changes))
         log.info("Set quotas for project:%s" % project.id)
     except nova_exceptions.BadRequest as e:
         log.error('Cannot set quotas:%s' % str(e))
     return {'nova_quota' : project.id}
 
+def plan_nova_quota(nova, keystone, **kwargs):
+    project = utils.find_project(keystone, kwargs.pop('tenant_name', None))
+    if not project:
+        return 'update', utils.changed_fields({}, kwargs)
+    return 'update', utils.changed_fields(nova.quotas.get(project.id), kwargs)
+
+def _port(port):
+    return None if port is None else int(port)
+
+def _rule_key(protocol, from_port, to_port, cidr):
+    # Rules with the same key are duplicates to nova
+    return (str(protocol).lower() if protocol else None,
+            _port(from_port), _port(to_port), cidr)
+
+def _config_rule_key(rule):
+    cidr = rule.get('cidr')
+    if not cidr and not rule.get('group_id'):
+        # nova default for rules without a source group
+        cidr = '0.0.0.0/0'
+    return _rule_key(rule.get('ip_protocol'), rule.get('from_port'),
+                     rule.get('to_port'), cidr)
+
+def _existing_rule_key(rule):
+    cidr = (rule.get('ip_range') or {}).get('cidr')
+    return _rule_key(rule.get('ip_protocol'), rule.get('from_port'),
+                     rule.get('to_port'), cidr)
+
+def _create_rule(nova, group_id, rule):
+    try:
+        r = nova.security_group_rules.create(group_id, **rule)
+        log.info("Created new rule:%s" % str(r))
+        return True
+    except nova_exceptions.BadRequest:
+        log.info('Cannot create rule, already exists:%s' % rule)
+    except nova_exceptions.CommandError, e:
+        log.error('Cannot create rule:%s' % e)
+    return False
+
+def _rule_changes(nova, group_id, rules, prune):
+    # Return rules missing from group and rules to remove from it
+    existing = {}
+    for rule in nova.security_groups.get(group_id).rules:
+        existing.setdefault(_existing_rule_key(rule), []).append(rule)
+    missing = []
+    wanted = set()
+    for rule in rules:
+        key = _config_rule_key(rule)
+        if key not in existing and key not in wanted:
+            missing.append(rule)
+        wanted.add(key)
+    stale = []
+    if prune:
+        for key, group_rules in existing.items():
+            if key not in wanted:
+                # Exported configs drop source groups, keep those rules
+                stale += [r for r in group_rules if not r.get('group')]
+    return missing, stale
+
+def _sync_rules(nova, group_id, rules, prune):
+    # Rules of the group are listed once, only missing rules are created
+    missing, stale = _rule_changes(nova, group_id, rules, prune)
+    created = 0
+    if missing:
+        workers = min(settings.SECURITY_GROUP_RULE_CONCURRENCY, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            created = sum(executor.map(
+                lambda rule: _create_rule(nova, group_id, rule), missing))
+    for rule in stale:
+        nova.security_group_rules.delete(rule['id'])
+        log.info('Removed rule not in config:%s' % rule['id'])
+    log.info('Security group:%s rules created:%s skipped:%s removed:%s' %
+             (group_id, created, len(rules) - len(missing), len(stale)))
+
 def create_security_group(nova, **kwargs):
     log.debug('Creating security group:%s' % kwargs)
     rules = kwargs.pop('rules', None)
+    prune = kwargs.pop('prune_rules', settings.SECURITY_GROUP_PRUNE_RULES)
     group_id = utils.find_sec_group(nova, kwargs['name'])
     if group_id:
         log.debug('Group already exists:%s' % group_id)
@@ -44,6 +132,7 @@ def create_security_group(nova, **kwargs):
             group = nova.security_groups.create(**kwargs)
             group_id = group.id # pylint: disable=no-member
             log.info('Created security group:%s' % group_id)
+            utils.name_index.add(nova, 'security_group', kwargs['name'], group)
         except nova_exceptions.BadRequest:
             # Group already exists
             group_id = utils.find_sec_group(nova, kwargs.pop('name', None))
@@ -51,27 +140,35 @@ def create_security_group(nova, **kwargs):
         except nova_exceptions.ClientException, e:
             log.error('Cannot create security group:%s' % e)
             return
-    for rule in rules:
-        try:
-            r = nova.security_group_rules.create(group_id, **rule)
-            log.info("Created new rule:%s" % str(r))
-        except nova_exceptions.BadRequest:
-            log.info('Cannot create rule, already exists:%s' % rule)
-            continue
-        except nova_exceptions.CommandError, e:
-            log.error('Cannot create rule:%s' % e)
-            continue
+    _sync_rules(nova, group_id, rules or [], prune)
     return {
         'security_group' : group_id,
         # projectid means tenant name, nova is dumb
         'os_tenant_name' : nova.projectid,
     }
 
+def plan_security_group(nova, **kwargs):
+    rules = kwargs.pop('rules', None) or []
+    prune = kwargs.pop('prune_rules', settings.SECURITY_GROUP_PRUNE_RULES)
+    group_id = utils.find_sec_group(nova, kwargs['name'])
+    if not group_id:
+        return 'create', {}
+    missing, stale = _rule_changes(nova, group_id, rules, prune)
+    changes = {}
+    if missing:
+        changes['rules created'] = (None, len(missing))
+    if stale:
+        changes['rules removed'] = (len(stale), None)
+    return 'update', changes
+
 def create_keypair(nova, **kwargs):
     log.debug('Creating keypair:%s' % kwargs)
     if kwargs['file']:
         with open(kwargs.pop('file'), 'r') as f:
             kwargs['public_key'] = f.read()
+    if _keypair_exists(nova, kwargs['name']):
+        log.info('Keypair already exists:%s' % kwargs['name'])
+        return {'keypair' : kwargs['name']}
     try:
         nova.keypairs.create(**kwargs)
         log.info('Created keypair:%s' % kwargs['name'])
@@ -79,6 +176,18 @@ def create_keypair(nova, **kwargs):
         log.info('Keypair already exists:%s' % kwargs['name'])
     return {'keypair' : kwargs['name']}
 
+def _keypair_exists(nova, name):
+    try:
+        nova.keypairs.get(name)
+        return True
+    except nova_exceptions.NotFound:
+        return False
+
+def plan_keypair(nova, **kwargs):
+    if not _keypair_exists(nova, kwargs['name']):
+        return 'create', {}
+    return 'update', {}
+
 def create_server(nova, neutron, cinder, **kwargs):
     log.debug('Create server:%s' % kwargs)
     name = kwargs.get('name')
@@ -116,66 +225,75 @@ def create_server(nova, neutron, cinder, **kwargs):
     else:
         server = nova.servers.create(**kwargs)
         log.info('Server created:%s' % server.id)
+        utils.name_index.add(nova, 'server', server.name, server)
     if wait:
         log.info("Waiting for server:%s, timeout:%s" % (server.id, timeout))
         utils.wait_status(nova.servers.get, server.id,
                           ['ACTIVE'], ['ERROR'], interval, timeout)
     return {'server' : server.id}
 
+def plan_server(nova, **kwargs):
+    if not utils.find_server(nova, kwargs['name']):
+        return 'create', {}
+    return 'update', {}
+
+def server_lister(nova):
+    '''Return function getting servers, or listing ones changed since the
+    previous list when many are waited on'''
+    state = {'since' : None}
+    def lister(obj_ids):
+        if len(obj_ids) <= settings.WAIT_GET_MAX:
+            return [nova.servers.get(obj_id) for obj_id in obj_ids]
+        search_opts = {}
+        if state['since']:
+            search_opts['changes-since'] = state['since']
+        wanted = set(obj_ids)
+        servers = []
+        for server in paging.paged_search(nova.servers.list,
+                                          search_opts=search_opts):
+            # use server timestamps so local clock skew does not matter
+            if state['since'] is None or server.updated > state['since']:
+                state['since'] = server.updated
+            if server.id in wanted:
+                servers.append(server)
+        return servers
+    return lister
+
 def save_flavors(nova):
     log.info('Saving flavor data')
-    flavors = nova.flavors.list() + nova.flavors.list(is_public=False)
-    skips = settings.EXPORT_KEYS_IGNORE + settings.EXPORT_SKIP_FLAVORS
-    flavor_data = []
+    flavors = paging.prefetch(itertools.chain(
+        paging.paged(nova.flavors.list),
+        paging.paged(nova.flavors.list, is_public=False)))
     for flavor in flavors:
-        flavor_args = vars(flavor)
-        for key in flavor_args.keys():
-            if key in skips:
-                flavor_args.pop(key)
+        flavor_args = records.FlavorRecord.from_resource(flavor).as_dict()
         # special to flavors
-        flavor_args['ephemeral'] = flavor_args.pop('OS-FLV-EXT-DATA:ephemeral', 0)
-        flavor_args['is_public'] = flavor_args.pop('os-flavor-access:is_public', True)
+        flavor_args.setdefault('ephemeral', 0)
+        flavor_args.setdefault('is_public', True)
         if flavor_args['swap'] == '':
             flavor_args['swap'] = 0
         else:
             flavor_args['swap'] = int(flavor_args.pop('swap', 0))
         flavor_args['name'] = str(flavor_args.pop('name'))
-        flavor_data.append({'flavor' : flavor_args})
-    return flavor_data
+        yield {'flavor' : flavor_args}
 
 def save_quotas(nova, tenant):
     quotas = nova.quotas.get(tenant.id)
-    quota_args = vars(quotas)
-    for key in quota_args.keys():
-        if key in settings.EXPORT_KEYS_IGNORE:
-            quota_args.pop(key)
+    quota_args = records.NovaQuotaRecord.from_resource(quotas).as_dict()
     quota_args['tenant_name'] = str(tenant.name)
     return {'nova_quota' : quota_args}
 
+def _rule_record(rule):
+    cidr = rule['ip_range'].get('cidr')
+    return records.RuleRecord(ip_protocol=str(rule['ip_protocol']),
+                              from_port=rule['from_port'],
+                              to_port=rule['to_port'],
+                              cidr=None if cidr is None else str(cidr))
+
 def save_security_groups(nova, tenant):
-    group_data = []
-    groups = nova.security_groups.list()
-    rule_skip = settings.EXPORT_SKIP_RULES + settings.EXPORT_KEYS_IGNORE
-    for group in groups:
-        group_args = vars(group)
-        group_args['name'] = str(group_args.pop('name'))
-        group_args['description'] = str(group_args.pop('description'))
-        for key in group_args.keys():
-            if key in settings.EXPORT_KEYS_IGNORE + ['tenant_id']:
-                group_args.pop(key)
-        for rule in group_args['rules']:
-            for key in rule.keys():
-                if key in rule_skip:
-                    rule.pop(key)
-            rule['ip_protocol'] = str(rule.pop('ip_protocol'))
-            rule['from_port'] = rule.pop('from_port')
-            rule['to_port'] = rule.pop('to_port')
-            ip_range = rule.pop('ip_range')
-            try:
-                rule['cidr'] = str(ip_range.pop('cidr'))
-            except KeyError:
-                rule['cidr'] = None
-        new_data = {'security_group' : group_args,
-                    'os_tenant_name' : str(tenant.name)}
-        group_data.append(new_data)
-    return group_data
+    for group in nova.security_groups.list():
+        record = records.SecurityGroupRecord.from_resource(group)
+        record.name = str(record.name)
+        record.description = str(record.description)
+        record.rules = [_rule_record(rule) for rule in record.rules]
+        yield {'security_group' : record.as_dict(),
+               'os_tenant_name' : str(tenant.name)}
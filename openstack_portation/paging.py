@@ -0,0 +1,116 @@
+from openstack_portation import settings
+
+import collections
+import logging
+import Queue
+import sys
+import threading
+
+log = logging.getLogger(__name__)
+
+def _marker(obj):
+    try:
+        return obj.id
+    except AttributeError:
+        return obj['id']
+
+def paged(list_function, page_size=None, **kwargs):
+    '''Yield objects of list_function(marker=, limit=), one call per page
+
+    Lists that ignore the marker return the first page again, they are
+    listed again in one unpaged call instead of being cut at a page.
+    '''
+    page_size = page_size or settings.LIST_PAGE_SIZE
+    marker = None
+    previous = set()
+    while True:
+        page_args = dict(kwargs, limit=page_size)
+        if marker is not None:
+            page_args['marker'] = marker
+        page = list(list_function(**page_args))
+        if page and _marker(page[0]) in previous:
+            log.debug('List ignores marker, listing without pages')
+            for obj in list_function(**kwargs):
+                if _marker(obj) not in previous:
+                    yield obj
+            return
+        for obj in page:
+            yield obj
+        # Short page is the last, a longer one means limit was ignored
+        if len(page) != page_size:
+            return
+        previous = set(_marker(obj) for obj in page)
+        marker = _marker(page[-1])
+
+def paged_search(list_function, page_size=None, search_opts=None, **kwargs):
+    '''Same as paged, for lists taking marker and limit as search options'''
+    lister = lambda **page_args: list_function(
+        search_opts=dict(search_opts or {}, **page_args), **kwargs)
+    return paged(lister, page_size=page_size)
+
+def paged_neutron(list_function, resource, page_size=None, **filters):
+    '''Yield neutron objects, following next links one page at a time'''
+    page_size = page_size or settings.LIST_PAGE_SIZE
+    for page in list_function(retrieve_all=False, limit=page_size, **filters):
+        for obj in page[resource + 's']:
+            yield obj
+
+def prefetch(iterable, size=None):
+    '''Yield from iterable consumed by a thread, up to size objects ahead
+
+    Lets the first objects be processed while later pages are fetched.
+    '''
+    if size is None:
+        size = settings.LIST_PAGE_SIZE * settings.LIST_PREFETCH_PAGES
+    if not size:
+        for obj in iterable:
+            yield obj
+        return
+    done = object()
+    queue = Queue.Queue(maxsize=size)
+    stop = threading.Event()
+    def put(item):
+        # Give up once the consumer stops iterating
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=1)
+                return True
+            except Queue.Full:
+                continue
+        return False
+    def fetch():
+        try:
+            for obj in iterable:
+                if not put((obj, None)):
+                    return
+        except Exception: #pylint: disable=broad-except
+            put((done, sys.exc_info()))
+            return
+        put((done, None))
+    thread = threading.Thread(target=fetch, name='prefetch')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            obj, error = queue.get()
+            if obj is done:
+                if error:
+                    raise error[0], error[1], error[2]
+                return
+            yield obj
+    finally:
+        stop.set()
+
+def window_map(executor, function, iterable, window):
+    '''Same as executor.map, with at most window calls submitted at once
+
+    executor.map consumes the whole iterable first, this takes the next
+    object only as results are yielded. Results keep the iterable order.
+    '''
+    pending = collections.deque()
+    for obj in iterable:
+        pending.append(executor.submit(function, obj))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,43 @@
+CREATE = 'create'
+UPDATE = 'update'
+NONE = 'none'
+
+SYMBOLS = {
+    CREATE : '+',
+    UPDATE : '~',
+    NONE : '=',
+}
+
+class PlanEntry(object):
+    '''Change a section of the config would make'''
+    def __init__(self, index, key, name, action, changes):
+        self.index = index
+        self.key = key
+        self.name = name
+        # Existing resources without changes need no writes
+        if action == UPDATE and not changes:
+            action = NONE
+        self.action = action
+        self.changes = changes
+
+    def __str__(self):
+        line = '%s [%s] %s %s' % (SYMBOLS[self.action], self.index, self.key,
+                                  self.name or '')
+        for field, (current, wanted) in sorted(self.changes.items()):
+            line += '\n      %s: %s -> %s' % (field, current, wanted)
+        return line
+
+
+def summary(entries):
+    counts = dict((action, 0) for action in SYMBOLS)
+    for entry in entries:
+        counts[entry.action] += 1
+    return counts
+
+def format_plan(entries):
+    '''Return plan as text, one line per section and one per changed field'''
+    lines = [str(entry) for entry in entries]
+    counts = summary(entries)
+    lines.append('Plan: %s to create, %s to update, %s unchanged' %
+                 (counts[CREATE], counts[UPDATE], counts[NONE]))
+    return '\n'.join(lines)
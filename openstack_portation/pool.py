@@ -0,0 +1,238 @@
+from openstack_portation import settings
+from openstack_portation import utils
+from openstack_portation.sessions import HttpPool
+
+from cinderclient.v1 import client as cinder_v1
+from glanceclient import Client as glance_client
+from keystoneclient import access
+from keystoneclient import exceptions as keystone_exceptions
+from keystoneclient import session as ks_session
+from keystoneclient.v2_0 import client as key_v2
+from neutronclient.v2_0 import client as neutron_v2
+from novaclient.v1_1 import client as nova_v1 #pylint: disable=no-name-in-module
+
+from concurrent.futures import Future
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+class TokenCache(object):
+    '''Tokens saved on disk, so runs within a token lifetime skip keystone
+
+    Entries are keyed by username, tenant and auth url, and only used when
+    the password given matches the salted PBKDF2 hash saved with the token.
+    '''
+    def __init__(self, path=settings.TOKEN_CACHE_FILE,
+                 expiry_window=settings.CLIENT_TOKEN_EXPIRY_WINDOW,
+                 rounds=settings.TOKEN_CACHE_KDF_ROUNDS):
+        self.path = os.path.expanduser(path)
+        self.expiry_window = expiry_window
+        self.rounds = rounds
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(username, tenant_name, auth_url):
+        return hashlib.sha256('\n'.join([username, tenant_name,
+                                         auth_url])).hexdigest()
+
+    @staticmethod
+    def _password_hash(salt, password, rounds):
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        return hashlib.pbkdf2_hmac('sha256', password, str(salt),
+                                   rounds).encode('hex')
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def get(self, username, password, tenant_name, auth_url):
+        with self._lock:
+            entry = self._read().get(self._key(username, tenant_name, auth_url))
+        # Entries of older versions have no rounds, they are replaced
+        if not entry or 'rounds' not in entry:
+            return None
+        if self._password_hash(entry['salt'], password,
+                               entry['rounds']) != entry['password']:
+            return None
+        auth_ref = access.AccessInfo.factory(body={'access' : entry['access']})
+        if auth_ref.will_expire_soon(stale_duration=self.expiry_window):
+            return None
+        log.debug('Using cached token for user:%s' % username)
+        return auth_ref
+
+    def set(self, username, password, tenant_name, auth_url, auth_ref):
+        salt = os.urandom(16).encode('hex')
+        password_hash = self._password_hash(salt, password, self.rounds)
+        with self._lock:
+            data = self._read()
+            data[self._key(username, tenant_name, auth_url)] = {
+                'salt' : salt,
+                'password' : password_hash,
+                'rounds' : self.rounds,
+                'access' : dict(auth_ref),
+            }
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory, 0700)
+            # Tokens are credentials, only the owner can read them
+            temp_path = '%s.tmp' % self.path
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.rename(temp_path, self.path)
+
+
+def _endpoint(keystone, service_type):
+    try:
+        return keystone.service_catalog.url_for(service_type=service_type)
+    except keystone_exceptions.EndpointNotFound:
+        return None
+
+class ClientBundle(object):
+    '''Authenticated service clients for one set of credentials
+
+    Keystone authenticates once, its token and catalog endpoints are given
+    to the other service clients so they do not authenticate again. All
+    clients send requests through the keep-alive session of the http pool.
+    '''
+    def __init__(self, username, password, tenant_name, auth_url,
+                 token_cache=None, http=None):
+        self.username = username
+        self.password = password
+        self.tenant_name = tenant_name
+        self.auth_url = auth_url
+        http = http or HttpPool()
+        http.metrics.register_endpoint(auth_url, 'keystone')
+        auth_ref = None
+        if token_cache:
+            auth_ref = token_cache.get(username, password, tenant_name, auth_url)
+        self.keystone = key_v2.Client(username=username,
+                                      password=password,
+                                      tenant_name=tenant_name,
+                                      auth_url=auth_url,
+                                      auth_ref=auth_ref,
+                                      session=ks_session.Session(
+                                          session=http.session))
+        if token_cache and auth_ref is None:
+            token_cache.set(username, password, tenant_name, auth_url,
+                            self.keystone.auth_ref)
+        token = self.keystone.auth_token
+        http.metrics.register_endpoint(self.keystone.management_url, 'keystone')
+        session = lambda service_type, service: http.token_session(
+            token, _endpoint(self.keystone, service_type), service)
+        self.nova = nova_v1.Client(username,
+                                   password,
+                                   tenant_name,
+                                   auth_url,
+                                   session=session('compute', 'nova'))
+        self.cinder = cinder_v1.Client(username,
+                                       password,
+                                       tenant_name,
+                                       auth_url,
+                                       session=session('volume', 'cinder'))
+        self.neutron = neutron_v2.Client(session=session('network', 'neutron'))
+        image_endpoint = self.keystone.service_catalog.url_for(service_type='image')
+        http.metrics.register_endpoint(image_endpoint, 'glance')
+        self.glance = glance_client('1', endpoint=image_endpoint, token=token)
+        # glance v1 does not take a session, its own holds the token headers
+        http.attach(self.glance.http_client.session)
+        # find lookups are indexed per set of credentials
+        utils.set_index_scope((auth_url, username, tenant_name),
+                              self.keystone, self.nova, self.cinder,
+                              self.neutron, self.glance)
+
+    def expires_soon(self, window):
+        auth_ref = getattr(self.keystone, 'auth_ref', None)
+        if auth_ref is None:
+            return False
+        return auth_ref.will_expire_soon(stale_duration=window)
+
+
+class ClientPool(object):
+    '''LRU pool of client bundles keyed by username, tenant and auth url'''
+    def __init__(self, max_size=settings.CLIENT_POOL_SIZE,
+                 expiry_window=settings.CLIENT_TOKEN_EXPIRY_WINDOW):
+        self.max_size = max_size
+        self.expiry_window = expiry_window
+        self.hits = self.misses = self.refreshes = self.evictions = 0
+        self._bundles = OrderedDict()
+        # Futures of bundles being authenticated, by key
+        self._building = {}
+        self._lock = threading.Lock()
+        self.http = HttpPool()
+        self.token_cache = None
+        if settings.TOKEN_CACHE:
+            self.token_cache = TokenCache(expiry_window=expiry_window)
+
+    def get(self, username, password, tenant_name, auth_url):
+        key = (username, tenant_name, auth_url)
+        with self._lock:
+            bundle = self._bundles.pop(key, None)
+            if bundle and bundle.password != password:
+                log.debug('Password changed for clients:%s' % (key,))
+                bundle = None
+            elif bundle and bundle.expires_soon(self.expiry_window):
+                log.debug('Token expiring, refreshing clients:%s' % (key,))
+                self.refreshes += 1
+                bundle = None
+            if bundle:
+                self.hits += 1
+                self._bundles[key] = bundle
+                return bundle
+            building = self._building.get(key)
+            if building is None:
+                self.misses += 1
+                building = self._building[key] = Future()
+                waiting = False
+            else:
+                self.hits += 1
+                waiting = True
+        if waiting:
+            # Another worker is authenticating the same credentials
+            bundle = building.result()
+            if bundle.password != password:
+                return self.get(username, password, tenant_name, auth_url)
+            return bundle
+        # Authenticate outside the lock, workers using other credentials
+        # .. do not wait on it
+        try:
+            bundle = ClientBundle(username, password, tenant_name, auth_url,
+                                  token_cache=self.token_cache,
+                                  http=self.http)
+        except Exception as e:
+            with self._lock:
+                self._building.pop(key)
+            building.set_exception(e)
+            raise
+        with self._lock:
+            self._building.pop(key)
+            self._bundles[key] = bundle
+            while len(self._bundles) > self.max_size:
+                old_key, _ = self._bundles.popitem(last=False)
+                log.debug('Evicting clients:%s' % (old_key,))
+                self.evictions += 1
+        building.set_result(bundle)
+        return bundle
+
+    def clear(self):
+        with self._lock:
+            self._bundles.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'refreshes' : self.refreshes,
+                'evictions' : self.evictions,
+                'size' : len(self._bundles),
+            }
@@ -0,0 +1,130 @@
+from openstack_portation import settings
+
+def _fields(obj):
+    # Only read fields already fetched, attribute access on an unloaded
+    # .. client resource would fetch it again
+    if isinstance(obj, dict):
+        return obj
+    return vars(obj)
+
+class Record(object):
+    '''Exported fields of a resource, copied from it when it is fetched
+
+    Records keep no reference to the client resource, its raw response or
+    its manager. Fields the resource does not have are left unset and are
+    not exported.
+    '''
+    __slots__ = ()
+    # Resource field each record field is copied from, if named differently
+    SOURCES = {}
+    # Name of the settings list of more fields not to export
+    SKIP_SETTING = None
+
+    def __init__(self, **fields):
+        for field, value in fields.items():
+            setattr(self, field, value)
+
+    @classmethod
+    def from_resource(cls, obj):
+        fields = _fields(obj)
+        record = cls()
+        for field in cls.__slots__:
+            source = cls.SOURCES.get(field, field)
+            if source in fields:
+                setattr(record, field, fields[source])
+        return record
+
+    def as_dict(self):
+        '''Return dict of set fields, without ignored or skipped fields'''
+        skips = list(settings.EXPORT_KEYS_IGNORE)
+        if self.SKIP_SETTING:
+            skips += getattr(settings, self.SKIP_SETTING)
+        data = {}
+        for field in self.__slots__:
+            if field in skips or self.SOURCES.get(field) in skips:
+                continue
+            try:
+                data[field] = getattr(self, field)
+            except AttributeError:
+                continue
+        return data
+
+
+class OpenRecord(Record):
+    '''Record of every data field of a resource, for resources whose fields
+    vary with the cloud, like quotas of each volume type'''
+    __slots__ = ('_fields',)
+    # Fields of the resource not exported, besides EXPORT_KEYS_IGNORE
+    IGNORE = ()
+
+    def __init__(self, **fields):
+        super(OpenRecord, self).__init__()
+        self._fields = fields
+
+    @classmethod
+    def from_resource(cls, obj):
+        record = cls()
+        # Client internals are left behind, like the manager and raw response
+        record._fields = dict((k, v) for k, v in _fields(obj).items()
+                              if not k.startswith('_') and k != 'manager')
+        return record
+
+    def __getattr__(self, name):
+        if name == '_fields':
+            raise AttributeError(name)
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def as_dict(self):
+        skips = list(settings.EXPORT_KEYS_IGNORE) + list(self.IGNORE)
+        return dict((k, v) for k, v in self._fields.items() if k not in skips)
+
+
+class UserRecord(OpenRecord):
+    __slots__ = ()
+    IGNORE = ('tenantId', 'username')
+
+
+class ProjectRecord(OpenRecord):
+    __slots__ = ()
+
+
+class FlavorRecord(Record):
+    __slots__ = ('id', 'name', 'ram', 'vcpus', 'disk', 'swap', 'rxtx_factor',
+                 'ephemeral', 'is_public')
+    SOURCES = {
+        'ephemeral' : 'OS-FLV-EXT-DATA:ephemeral',
+        'is_public' : 'os-flavor-access:is_public',
+    }
+    SKIP_SETTING = 'EXPORT_SKIP_FLAVORS'
+
+
+class NovaQuotaRecord(OpenRecord):
+    __slots__ = ()
+
+
+class CinderQuotaRecord(OpenRecord):
+    __slots__ = ()
+
+
+class RuleRecord(Record):
+    __slots__ = ('ip_protocol', 'from_port', 'to_port', 'cidr')
+    SKIP_SETTING = 'EXPORT_SKIP_RULES'
+
+
+class SecurityGroupRecord(Record):
+    __slots__ = ('id', 'name', 'description', 'rules')
+
+    def as_dict(self):
+        data = super(SecurityGroupRecord, self).as_dict()
+        # Rules are RuleRecords once copied from the resource
+        data['rules'] = [rule.as_dict() for rule in data.get('rules', [])]
+        return data
+
+
+class ImageRecord(Record):
+    __slots__ = ('id', 'name', 'disk_format', 'container_format', 'checksum',
+                 'is_public', 'protected', 'min_disk', 'min_ram', 'properties',
+                 'owner')
@@ -0,0 +1,165 @@
+from openstack_portation.exceptions import OpenStackPortationError
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import heapq
+import logging
+
+log = logging.getLogger(__name__)
+
+AUTH_KEYS = ['os_username', 'os_password', 'os_tenant_name', 'os_auth_url']
+
+# Section keys that create a resource that other sections can find by name
+PRODUCERS = ['user', 'project', 'flavor', 'security_group', 'keypair',
+             'image', 'network', 'subnet', 'router', 'volume', 'server']
+
+class Node(object):
+    '''Single section of an action in the import graph'''
+    def __init__(self, position, action_index, key, data, auth):
+        self.position = position
+        self.action_index = action_index
+        self.key = key
+        self.data = data
+        self.auth = auth
+        self.depends = set()
+        self.dependents = set()
+        # Earlier sections writing the same resource, only ordered after them
+        self.follows = set()
+        self.followers = set()
+
+    def __repr__(self):
+        return 'Node(action:%s, section:%s)' % (self.action_index, self.key)
+
+def section_refs(key, data, auth):
+    # Return list of (resource, name) the section looks up
+    refs = []
+    if key in ['nova_quota', 'cinder_quota', 'network', 'subnet', 'router',
+               'source_file']:
+        refs.append(('project', data.get('tenant_name')))
+    if key in ['project', 'source_file']:
+        refs.append(('user', data.get('user')))
+    if key == 'subnet':
+        refs.append(('network', data.get('network')))
+    if key == 'router':
+        refs.append(('network', data.get('external_network')))
+        refs.append(('subnet', data.get('internal_subnet')))
+    if key == 'volume':
+        refs.append(('image', data.get('image_name')))
+    if key == 'server':
+        refs.append(('flavor', data.get('flavor_name')))
+        refs.append(('image', data.get('image_name')))
+        refs.append(('keypair', data.get('key_name')))
+        for nic in data.get('nics', []):
+            refs.append(('network', nic.get('network_name')))
+        for volume in data.get('volumes', []):
+            refs.append(('volume', volume.get('volume_name')))
+        for group in data.get('security_groups', []):
+            refs.append(('security_group', group))
+    # Credential overrides need the user and project to exist
+    refs.append(('project', auth.get('os_tenant_name')))
+    refs.append(('user', auth.get('os_username')))
+    if key in PRODUCERS:
+        # Sections with the same name must run in order
+        refs.append((key, data.get('name')))
+    return [ref for ref in refs if ref[1]]
+
+def section_target(key, data):
+    # Return (section key, name) of the resource a section writes
+    return (key, data.get('tenant_name') or data.get('name'))
+
+def build_graph(config):
+    '''Build list of nodes from config, each depending on earlier producers
+
+    Other sections writing the same resource run in config order, so the
+    last one in the config wins as in a serial import.
+    '''
+    nodes = []
+    producers = {}
+    writers = {}
+    for action_index, action in enumerate(config):
+        auth = dict((k, action[k]) for k in AUTH_KEYS if k in action)
+        for key, data in action.iteritems():
+            if key in AUTH_KEYS:
+                continue
+            node = Node(len(nodes), action_index, key, data, auth)
+            for ref in section_refs(key, data, auth):
+                producer = producers.get(ref)
+                if producer is not None:
+                    node.depends.add(producer)
+                    producer.dependents.add(node)
+            if key in PRODUCERS and data.get('name'):
+                producers[(key, data['name'])] = node
+            elif key not in PRODUCERS:
+                target = section_target(key, data)
+                writer = writers.get(target)
+                if writer is not None and writer not in node.depends:
+                    node.follows.add(writer)
+                    writer.followers.add(node)
+                writers[target] = node
+            nodes.append(node)
+    return nodes
+
+def _dependents(node):
+    # All nodes depending on node, directly or through other nodes
+    found = set()
+    stack = list(node.dependents)
+    while stack:
+        child = stack.pop()
+        if child not in found:
+            found.add(child)
+            stack.extend(child.dependents)
+    return found
+
+def run_graph(nodes, function, concurrency):
+    '''Run function(node) on a worker pool once all node depends are done
+
+    Returns (results, errors), both ordered by node position. Failed nodes
+    cancel all nodes that depend on them, cancelled nodes are in errors
+    too. Everything else still runs, nodes only following a failed node
+    included.
+    '''
+    results = {}
+    errors = {}
+    # Nodes are ready once their count of unfinished depends reaches zero
+    unmet = dict((node, len(node.depends) + len(node.follows))
+                 for node in nodes)
+    ready = [(node.position, node) for node in nodes if not unmet[node]]
+    heapq.heapify(ready)
+    running = {}
+    def release(children):
+        for child in children:
+            if child.position in errors:
+                continue
+            unmet[child] -= 1
+            if not unmet[child]:
+                heapq.heappush(ready, (child.position, child))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while ready or running:
+            while ready:
+                _, node = heapq.heappop(ready)
+                running[executor.submit(function, node)] = node
+            finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                try:
+                    results[node.position] = future.result()
+                except Exception as e: #pylint: disable=broad-except
+                    log.error('Section failed %s:%s' % (node, e))
+                    errors[node.position] = e
+                    # Dependents of a failed node never become ready
+                    cancelled = _dependents(node)
+                    for child in cancelled:
+                        if child.position not in errors:
+                            log.error('Section cancelled, dependency '
+                                      'failed:%s' % child)
+                            errors[child.position] = OpenStackPortationError(
+                                'Cancelled, dependency failed:%s' % node)
+                    # .. nodes only following them still run
+                    for child in [node] + list(cancelled):
+                        release(child.followers)
+                    continue
+                release(node.dependents | node.followers)
+    ordered_results = [(n, results[n.position]) for n in nodes
+                       if n.position in results]
+    ordered_errors = [(n, errors[n.position]) for n in nodes
+                      if n.position in errors]
+    return ordered_results, ordered_errors
@@ -1,4 +1,9 @@
 from openstack_portation import settings
+from openstack_portation.exceptions import ConfigValidationError
+
+from jsonschema.validators import validator_for
+import sys
+import threading
 
 SCHEMA = {
     "title": "actions",
@@ -124,6 +129,10 @@ SCHEMA = {
                     },
                     "description": {
                         "type": ["string", "null"]
+                    },
+                    "prune_rules": {
+                        "type": "boolean",
+                        "default": settings.SECURITY_GROUP_PRUNE_RULES
                     }
                 },
                 "required": ["name", "description"],
@@ -141,6 +150,10 @@ SCHEMA = {
                     },
                     "email": {
                         "type": ["string", "null"]
+                    },
+                    "reset_password": {
+                        "type": "boolean",
+                        "default": settings.USER_RESET_PASSWORD
                     }
                 },
                 "required": ["name", "password"]
@@ -369,3 +382,81 @@ SCHEMA = {
         }
     }
 }
+
+_VALIDATORS = {}
+
+def _validator(schema):
+    # Build each validator once, checking schema is only needed once too
+    validator = _VALIDATORS.get(id(schema))
+    if validator is None:
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        validator = _VALIDATORS[id(schema)] = cls(schema)
+    return validator
+
+def action_errors(index, action):
+    '''Return list of (index, message) for each error in action'''
+    validator = _validator(SCHEMA['items'])
+    return [(index, error.message) for error in
+            sorted(validator.iter_errors(action), key=lambda e: list(e.path))]
+
+def _check_list(config):
+    if not isinstance(config, list):
+        raise ConfigValidationError([(None, 'config must be list of actions')])
+
+def validate_config(config):
+    '''Validate every action, raise listing all invalid actions'''
+    _check_list(config)
+    errors = []
+    for index, action in enumerate(config):
+        errors += action_errors(index, action)
+    if errors:
+        raise ConfigValidationError(errors)
+
+
+class ActionValidator(object):
+    '''Validate actions in a background thread while earlier actions run'''
+    def __init__(self, config):
+        _check_list(config)
+        self.config = config
+        self.errors = []
+        self.invalid = set()
+        self._validated = -1
+        # Index of the action validation failed on, and the exception
+        self._failure = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self.__run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __run(self):
+        try:
+            for index, action in enumerate(self.config):
+                errors = action_errors(index, action)
+                with self._condition:
+                    if errors:
+                        self.errors += errors
+                        self.invalid.add(index)
+                    self._validated = index
+                    self._condition.notify_all()
+        except Exception: #pylint: disable=broad-except
+            # Release waiting actions, they raise the failure
+            with self._condition:
+                self._failure = (self._validated + 1, sys.exc_info())
+                self._validated = len(self.config) - 1
+                self._condition.notify_all()
+
+    def wait(self, index):
+        '''Block until action is validated, raise if it is not valid'''
+        with self._condition:
+            while self._validated < index:
+                self._condition.wait()
+            invalid = index in self.invalid
+            failure = self._failure
+        if failure and index >= failure[0]:
+            exc_type, value, traceback = failure[1]
+            raise exc_type, value, traceback
+        if invalid:
+            # Finish the pass so every invalid action is reported
+            self._thread.join()
+            raise ConfigValidationError(self.errors)
@@ -0,0 +1,131 @@
+from openstack_portation.exceptions import OpenStackPortationError
+
+import json
+import os
+import yaml
+
+# Use libyaml when it is available, much faster for large configs
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+EXTENSIONS = {
+    'yml' : 'yaml',
+    'yaml' : 'yaml',
+    'json' : 'json',
+    'jsonl' : 'jsonl',
+    'msgpack' : 'msgpack',
+    'mp' : 'msgpack',
+}
+
+FORMATS = ['yaml', 'json', 'jsonl', 'msgpack']
+
+class YamlWriter(object):
+    '''Write each record as an item of a YAML list'''
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(yaml.dump([record], Dumper=YamlDumper,
+                                    default_flow_style=False))
+        # Flush so records written survive a crash
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class JsonWriter(object):
+    '''Write records as a JSON list, one record per line'''
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, record):
+        self.stream.write('[\n' if not self.count else ',\n')
+        self.stream.write(json.dumps(record, sort_keys=True))
+        self.stream.flush()
+        self.count += 1
+
+    def close(self):
+        self.stream.write('\n]\n' if self.count else '[]\n')
+
+
+class JsonLinesWriter(object):
+    '''Write each record as a line of JSON'''
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class MsgpackWriter(object):
+    '''Write each record as a msgpack object'''
+    def __init__(self, stream):
+        self.stream = stream
+        self.packer = msgpack.Packer(use_bin_type=True)
+
+    def write(self, record):
+        self.stream.write(self.packer.pack(record))
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'yaml' : YamlWriter,
+    'json' : JsonWriter,
+    'jsonl' : JsonLinesWriter,
+    'msgpack' : MsgpackWriter,
+}
+
+def format_from_path(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return EXTENSIONS.get(extension, 'yaml')
+
+def _check_format(file_format):
+    if file_format not in FORMATS:
+        raise OpenStackPortationError('Unknown format:%s' % file_format)
+    if file_format == 'msgpack' and msgpack is None:
+        raise OpenStackPortationError('msgpack format needs the msgpack '
+                                      'package installed')
+
+def write_records(path, records, file_format=None):
+    '''Write records to file as they are produced, return number written'''
+    file_format = file_format or format_from_path(path)
+    _check_format(file_format)
+    count = 0
+    mode = 'wb' if file_format == 'msgpack' else 'w'
+    with open(path, mode) as f:
+        writer = WRITERS[file_format](f)
+        for record in records:
+            writer.write(record)
+            count += 1
+        writer.close()
+    return count
+
+def load_records(path, file_format=None):
+    '''Load list of records from file'''
+    file_format = file_format or format_from_path(path)
+    _check_format(file_format)
+    if file_format == 'msgpack':
+        with open(path, 'rb') as f:
+            return list(msgpack.Unpacker(f, raw=False))
+    with open(path, 'r') as f:
+        if file_format == 'yaml':
+            return yaml.load(f, Loader=YamlLoader)
+        if file_format == 'json':
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,94 @@
+from openstack_portation import settings
+from openstack_portation.metrics import ApiMetrics
+from openstack_portation.throttle import Throttle, ThrottledAdapter
+
+from keystoneclient import session as ks_session
+from keystoneclient.auth import token_endpoint
+from keystoneclient.auth.identity import v2 as v2_auth
+
+import logging
+import requests
+import threading
+import weakref
+
+log = logging.getLogger(__name__)
+
+class HttpPool(object):
+    '''Keep-alive HTTP session shared by every service client
+
+    Each host gets a pool of up to maxsize connections, grow the pool to at
+    least the number of workers making requests at once. Every response is
+    recorded in metrics, every request is rate limited and retried by the
+    throttle of its service.
+    '''
+    def __init__(self, maxsize=settings.HTTP_POOL_MAXSIZE,
+                 hosts=settings.HTTP_POOL_HOSTS):
+        self.maxsize = 0
+        self.hosts = hosts
+        self.session = requests.Session()
+        self.metrics = ApiMetrics()
+        self.session.hooks['response'].append(self.metrics.response_hook)
+        self.throttle = Throttle(self.metrics.service, maxsize)
+        self._adapters = []
+        # Sessions of clients that keep their own headers, sharing the pool
+        # .. while their client bundle is alive
+        self._sessions = weakref.WeakSet([self.session])
+        self._lock = threading.Lock()
+        self.ensure_size(maxsize)
+
+    def ensure_size(self, maxsize):
+        with self._lock:
+            if maxsize <= self.maxsize:
+                return
+            log.debug('Resizing HTTP pool to %s connections per host' % maxsize)
+            adapter = ThrottledAdapter(self.throttle,
+                                       pool_connections=self.hosts,
+                                       pool_maxsize=maxsize)
+            for session in self._sessions:
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+            self._adapters.append(adapter)
+            self.maxsize = maxsize
+        self.throttle.resize(maxsize)
+
+    def attach(self, session):
+        '''Send requests of a client's own session through the shared pool
+
+        The session keeps its headers, so tokens set on it stay with it.
+        '''
+        with self._lock:
+            session.hooks['response'].append(self.metrics.response_hook)
+            adapter = self._adapters[-1]
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._sessions.add(session)
+
+    def token_session(self, token, endpoint, service=None):
+        '''Session using existing token and endpoint, never authenticates'''
+        if service:
+            self.metrics.register_endpoint(endpoint, service)
+        return ks_session.Session(auth=token_endpoint.Token(endpoint, token),
+                                  session=self.session)
+
+    def password_session(self, username, password, tenant_name, auth_url):
+        auth = v2_auth.Password(auth_url=auth_url, username=username,
+                                password=password, tenant_name=tenant_name)
+        return ks_session.Session(auth=auth, session=self.session)
+
+    def stats(self):
+        requests_made = connections = 0
+        with self._lock:
+            for adapter in self._adapters:
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_made += pool.num_requests
+                    connections += pool.num_connections
+        return {
+            'requests' : requests_made,
+            'connections' : connections,
+            'reused' : requests_made - connections,
+            'pool_maxsize' : self.maxsize,
+        }
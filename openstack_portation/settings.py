@@ -12,6 +12,18 @@ SERVER_WAIT = False
 SERVER_WAIT_TIMEOUT = 1800
 SERVER_WAIT_INTERVAL = 5
 
+# Wait intervals above are the first interval, each poll after multiplies
+# .. the interval by the backoff up to the max, +/- random jitter
+WAIT_BACKOFF = 1.5
+WAIT_MAX_INTERVAL = 60
+WAIT_JITTER = 0.2
+# Waits on up to this many servers or volumes get each one per poll, waits on
+# .. more list the tenant a page at a time, the list apis have no id filter.
+# .. Images are always got one by one
+WAIT_GET_MAX = 5
+# Serial imports only block on a wait once a later section uses the resource
+DEFER_WAITS = True
+
 EXPORT_KEYS_IGNORE = ['_loaded', '_info', 'id', 'manager', 'links',
                       'created_at', 'updated_at', 'status', 'size']
 EXPORT_SKIP_USERS = ['nova', 'cinder', 'glance', 'neutron']
@@ -21,4 +33,77 @@ EXPORT_SKIP_FLAVORS = ['OS-FLV-DISABLED:disabled']
 
 EXPORT_SKIP_RULES = ['group', 'parent_group_id']
 
+# List security groups of all tenants with one admin neutron call, instead of
+# .. authenticating a temp user in every tenant
+EXPORT_BULK_SECURITY_GROUPS = True
+# Export roles from one v3 role assignment listing instead of v2 membership
+# .. queries per project and member. Members are then ordered as users are
+# .. listed, and their roles as roles are listed
+EXPORT_V3_ROLE_ASSIGNMENTS = True
+
+# Bytes read at a time when checksumming saved image data
+IMAGE_CHUNK_SIZE = 64 * 1024
+
 DEFAULT_SAVE_PATH = 'openstack-account-saves'
+
+# Validate actions in the background while earlier actions are imported,
+# .. an invalid action is only found once the actions before it have run
+VALIDATE_INCREMENTAL = False
+
+# Number of sections imported at once, 1 imports serially in config order
+IMPORT_CONCURRENCY = 1
+# Number of tenants exported at once
+EXPORT_CONCURRENCY = 1
+
+# Authenticated client bundles kept for reuse between actions
+CLIENT_POOL_SIZE = 8
+# Rebuild bundle if token expires within this many seconds
+CLIENT_TOKEN_EXPIRY_WINDOW = 300
+# Save tokens on disk so repeated runs skip authentication. Tokens are
+# .. credentials, only enable on hosts where the file stays private
+TOKEN_CACHE = False
+TOKEN_CACHE_FILE = '~/.openstack-portation/tokens.json'
+# PBKDF2 rounds of the password hash saved with each token
+TOKEN_CACHE_KDF_ROUNDS = 200000
+
+# Keep-alive connections kept per API host, grown to match concurrency
+HTTP_POOL_MAXSIZE = 10
+# Number of API hosts to keep connection pools for
+HTTP_POOL_HOSTS = 10
+
+# Calls per second allowed to each service, None for no limit
+RATE_LIMIT = 20
+# Per service overrides of RATE_LIMIT, by name e.g. 'nova', 'neutron'
+RATE_LIMITS = {}
+RATE_LIMIT_BURST = 10
+# Retries of throttled calls, and of failed idempotent calls
+API_RETRIES = 5
+API_RETRY_INTERVAL = 1
+API_RETRY_MAX_INTERVAL = 30
+# Calls faster than this grow the number of calls allowed in flight
+HEALTHY_LATENCY = 2
+# Seconds after halving calls in flight before it can be halved again
+THROTTLE_COOLDOWN = 1
+
+# Create consecutive network or subnet actions with neutron bulk requests
+NEUTRON_BULK_CREATE = True
+# Most networks or subnets created by one bulk request
+NEUTRON_BULK_SIZE = 100
+
+# Security group rules created at once
+SECURITY_GROUP_RULE_CONCURRENCY = 8
+# Delete rules of existing security groups that are not in the config
+SECURITY_GROUP_PRUNE_RULES = False
+
+# Sections imported before with the same spec are skipped if their resource
+# .. still exists, fingerprints of imported sections are kept in this file
+FINGERPRINT_CACHE_FILE = '~/.openstack-portation/fingerprints.db'
+
+# Objects requested per page when listing resources
+LIST_PAGE_SIZE = 1000
+# Pages fetched ahead of the records being exported, 0 to fetch on demand
+LIST_PREFETCH_PAGES = 1
+
+# Set the password of users that already exist, passwords cannot be read
+# .. back to check them first. False to leave existing passwords alone
+USER_RESET_PASSWORD = True
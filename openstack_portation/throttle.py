@@ -0,0 +1,233 @@
+from openstack_portation import settings
+from openstack_portation import utils
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
+
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+
+# Rejected before being processed, safe to retry any method
+THROTTLE_STATUSES = [429]
+# Only retried for idempotent methods
+RETRY_STATUSES = [502, 503, 504]
+
+def retry_after(response):
+    '''Return seconds from Retry-After header, None if missing or a date'''
+    value = response.headers.get('Retry-After')
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+def _quota_exceeded(response):
+    # nova answers exceeded quotas with an overLimit 413 too
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    over_limit = body.get('overLimit') if isinstance(body, dict) else None
+    if not isinstance(over_limit, dict):
+        return False
+    return 'quota' in over_limit.get('message', '').lower()
+
+def is_throttled(response):
+    if response.status_code in THROTTLE_STATUSES:
+        return True
+    if response.status_code != 413:
+        return False
+    # nova rate limits give a wait, an exceeded quota has none or 0 and will
+    # .. not pass when retried
+    delay = retry_after(response)
+    return bool(delay) and not _quota_exceeded(response)
+
+
+class TokenBucket(object):
+    '''Allow rate calls per second, with bursts of up to burst calls'''
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                if now >= self.paused_until:
+                    self.tokens = min(self.burst, self.tokens +
+                                      (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        '''Hand out no tokens for seconds, as asked by Retry-After'''
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self.tokens = 0
+
+
+class AdaptiveLimit(object):
+    '''Calls in flight, halved when throttled and grown by one per window
+
+    A window is limit calls in a row under healthy_latency, so the limit
+    settles at the most calls the service takes without throttling.
+    '''
+    def __init__(self, maximum, healthy_latency):
+        self.maximum = maximum
+        self.limit = maximum
+        self.healthy_latency = healthy_latency
+        self.in_flight = 0
+        self.successes = 0
+        self.decreased = 0
+        self._condition = threading.Condition()
+
+    def resize(self, maximum):
+        with self._condition:
+            # Keep any reduction made while throttled
+            self.limit = max(1, min(maximum,
+                                    self.limit + maximum - self.maximum))
+            self.maximum = maximum
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, throttled):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.time()
+            if throttled:
+                self.successes = 0
+                # Calls in flight when throttled would halve it again
+                if now - self.decreased > settings.THROTTLE_COOLDOWN:
+                    self.limit = max(1, self.limit // 2)
+                    self.decreased = now
+                    log.info('Throttled, limiting calls in flight to %s' %
+                             self.limit)
+            elif latency is not None and latency < self.healthy_latency:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self._condition.notify_all()
+
+
+class Throttle(object):
+    '''Token bucket and adaptive limit of calls in flight for each service'''
+    def __init__(self, service_function, maximum):
+        self.service_function = service_function
+        self.maximum = maximum
+        self.throttled = 0
+        self.retries = 0
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def _get(self, service):
+        with self._lock:
+            if service not in self._services:
+                rate = settings.RATE_LIMITS.get(service, settings.RATE_LIMIT)
+                bucket = None
+                if rate:
+                    bucket = TokenBucket(rate, settings.RATE_LIMIT_BURST)
+                limit = AdaptiveLimit(self.maximum, settings.HEALTHY_LATENCY)
+                self._services[service] = (bucket, limit)
+            return self._services[service]
+
+    def resize(self, maximum):
+        with self._lock:
+            self.maximum = maximum
+            limits = [limit for _, limit in self._services.values()]
+        for limit in limits:
+            limit.resize(maximum)
+
+    def call(self, url, method, send, replayable=True):
+        '''Call send() once a slot is free, retry while throttled
+
+        Calls that are not replayable, e.g. with a streamed body already
+        read by the first attempt, are never retried.
+        '''
+        bucket, limit = self._get(self.service_function(url))
+        intervals = utils.backoff_intervals(
+            settings.API_RETRY_INTERVAL,
+            max_interval=settings.API_RETRY_MAX_INTERVAL)
+        attempt = 0
+        while True:
+            attempt += 1
+            retries_left = replayable and attempt <= settings.API_RETRIES
+            if bucket:
+                bucket.acquire()
+            limit.acquire()
+            start = time.time()
+            try:
+                response = send()
+            except (RequestsConnectionError, Timeout):
+                limit.release(None, False)
+                if method not in IDEMPOTENT_METHODS or not retries_left:
+                    raise
+                delay = next(intervals)
+                log.debug('Connection failed, retrying %s %s in %.1fs' %
+                          (method, url, delay))
+            else:
+                throttled = is_throttled(response)
+                limit.release(time.time() - start, throttled)
+                if throttled:
+                    with self._lock:
+                        self.throttled += 1
+                retry = throttled or (response.status_code in RETRY_STATUSES
+                                      and method in IDEMPOTENT_METHODS)
+                if not retry or not retries_left:
+                    return response
+                delay = retry_after(response)
+                if delay is None:
+                    delay = next(intervals)
+                elif bucket:
+                    bucket.pause(delay)
+                log.debug('Got %s, retrying %s %s in %.1fs' %
+                          (response.status_code, method, url, delay))
+                response.close()
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'throttled' : self.throttled,
+                'retries' : self.retries,
+                'limits' : dict((service, limit.limit) for service, (_, limit)
+                                in self._services.items()),
+            }
+
+
+class ThrottledAdapter(HTTPAdapter):
+    '''HTTP adapter sending every request through a throttle'''
+    def __init__(self, throttle, **kwargs):
+        self.throttle = throttle
+        super(ThrottledAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs): #pylint: disable=arguments-differ
+        parent = super(ThrottledAdapter, self)
+        # File and generator bodies are consumed by sending them
+        replayable = request.body is None or \
+            isinstance(request.body, basestring)
+        return self.throttle.call(request.url, request.method,
+                                  lambda: parent.send(request, **kwargs),
+                                  replayable=replayable)
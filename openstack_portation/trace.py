@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+class Tracer(object):
+    '''Timeline of spans written in Chrome trace event format
+
+    Disabled by default, spans cost a single check until enabled. Load the
+    written file in chrome://tracing or Perfetto.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._threads = {}
+        self._start = time.time()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        with self._lock:
+            self.enabled = True
+            self.events = []
+            self._threads = {}
+            self._start = time.time()
+
+    def disable(self):
+        self.enabled = False
+
+    @contextmanager
+    def span(self, name, category='portation', **args):
+        '''Record time spent in block, spans in a span are nested under it'''
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.time() - start, args)
+
+    def add(self, name, category, start, duration, args=None):
+        '''Record span that already finished'''
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        event = {
+            'name' : name,
+            'cat' : category,
+            'ph' : 'X',
+            'ts' : int((start - self._start) * 1000000),
+            'dur' : int(duration * 1000000),
+            'pid' : os.getpid(),
+            'tid' : thread.ident,
+            'args' : args or {},
+        }
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+            self.events.append(event)
+
+    def write(self, path):
+        log.info('Writing trace of %s events to file:%s' %
+                 (len(self.events), path))
+        with self._lock:
+            events = list(self.events)
+            # Name threads so workers are labelled in the viewer
+            for tid, name in self._threads.items():
+                events.append({'name' : 'thread_name', 'ph' : 'M',
+                               'pid' : os.getpid(), 'tid' : tid,
+                               'args' : {'name' : name}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents' : events, 'displayTimeUnit' : 'ms'}, f)
+
+tracer = Tracer()
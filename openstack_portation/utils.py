@@ -1,9 +1,23 @@
+from openstack_portation import paging
+from openstack_portation import settings
+from openstack_portation.cache import NameIndex
+
 from contextlib import contextmanager
 import os
 import random
 import string
 import time
 
+# Run scoped index used by all find functions
+name_index = NameIndex()
+
+# Fields returned by neutron lookups, everything callers use
+NEUTRON_FIELDS = {
+    'network' : ['id', 'name', 'tenant_id'],
+    'subnet' : ['id', 'name', 'tenant_id', 'network_id'],
+    'router' : ['id', 'name', 'tenant_id'],
+}
+
 def check_directory(path):
     assert isinstance(path, basestring), 'path must be string'
     abspath = os.path.abspath(path)
@@ -16,18 +30,49 @@ def random_string(prefix='', length=20):
     s = ''.join(random.choice(chars) for _ in range(length))
     return prefix + s
 
+def backoff_intervals(interval, factor=None, max_interval=None, jitter=None):
+    factor = factor or settings.WAIT_BACKOFF
+    max_interval = max_interval or settings.WAIT_MAX_INTERVAL
+    jitter = settings.WAIT_JITTER if jitter is None else jitter
+    while True:
+        yield interval * random.uniform(1 - jitter, 1 + jitter)
+        interval = min(interval * factor, max_interval)
+
+def wait_statuses(list_function, obj_ids, accept_states, reject_states,
+                  interval, timeout):
+    '''Wait on many objects, list_function(ids) is called once per poll
+
+    list_function can return any objects, ones not waited on are ignored
+    and ones not returned are polled again. Returns dict of id to object,
+    None for objects in reject state or not done before the timeout.
+    '''
+    pending = set(obj_ids)
+    results = {}
+    expires = time.time() + timeout
+    intervals = backoff_intervals(interval)
+    while pending:
+        for obj in list_function(sorted(pending)):
+            if obj.id not in pending:
+                continue
+            if obj.status in accept_states:
+                results[obj.id] = obj
+                pending.discard(obj.id)
+            elif obj.status in reject_states:
+                results[obj.id] = None
+                pending.discard(obj.id)
+        remaining = expires - time.time()
+        if not pending or remaining <= 0:
+            break
+        time.sleep(min(next(intervals), remaining))
+    for obj_id in pending:
+        results[obj_id] = None
+    return results
+
 def wait_status(function, obj_id, accept_states, reject_states,
                 interval, timeout):
-    obj = function(obj_id)
-    expires = time.time() + timeout
-    while time.time() <= expires:
-        if obj.status in accept_states:
-            return obj
-        if obj.status in reject_states:
-            return None
-        time.sleep(interval)
-        obj = function(obj_id)
-    return None
+    lister = lambda obj_ids: [function(obj_id)]
+    return wait_statuses(lister, [obj_id], accept_states, reject_states,
+                         interval, timeout)[obj_id]
 
 @contextmanager
 def temp_user(keystone):
@@ -48,89 +93,161 @@ def pretty_dict(data):
         data[key] = str(value)
     return data
 
+def _same(old, new):
+    if old == new:
+        return True
+    # Exported values are strings, e.g. numbers and None
+    if isinstance(old, basestring) or isinstance(new, basestring):
+        return unicode(old) == unicode(new)
+    return False
+
+def changed_fields(obj, wanted):
+    '''Return dict of field -> (current, wanted) for fields that differ
+
+    obj can be a client resource or a dict.
+    '''
+    changes = {}
+    for key, value in wanted.iteritems():
+        if isinstance(obj, dict):
+            current = obj.get(key)
+        else:
+            current = getattr(obj, key, None)
+        if not _same(current, value):
+            changes[key] = (current, value)
+    return changes
+
+def set_index_scope(scope, *clients):
+    # Clients sharing a scope share indexed resources
+    for client in clients:
+        client.index_scope = scope
+
+def _find(client, resource, name, list_function, name_key='name'):
+    def lister():
+        for obj in list_function():
+            try:
+                yield getattr(obj, name_key), obj
+            except AttributeError:
+                yield obj[name_key], obj
+    return name_index.find(client, resource, name, lister)
+
 def find_sec_group(nova, name):
-    for group in nova.security_groups.list():
-        if group.name == name:
-            return group.id
+    for group in _find(nova, 'security_group', name, nova.security_groups.list):
+        return group.id
     return None
 
 def find_flavor(nova, name):
-    for flavor in nova.flavors.list():
-        if flavor.name == name:
-            return flavor.id
+    for flavor in _find(nova, 'flavor', name,
+                        lambda: paging.paged(nova.flavors.list)):
+        return flavor.id
     return None
 
 def find_server(nova, name):
-    for server in nova.servers.list():
-        if server.name == name:
-            return server
+    for server in _find(nova, 'server', name,
+                        lambda: paging.paged_search(nova.servers.list)):
+        return server
     return None
 
 def find_image(nova, name):
-    for image in nova.images.list():
-        if image.name == name:
-            return image
+    for image in _find(nova, 'image', name,
+                       lambda: paging.paged(nova.images.list)):
+        return image
+    return None
+
+def find_glance_image(glance, name):
+    for image in _find(glance, 'glance_image', name,
+                       lambda: paging.paged(glance.images.list)):
+        return image
     return None
 
 def find_volume(cinder, name):
-    for volume in cinder.volumes.list():
-        if volume.display_name == name:
-            return volume
+    for volume in _find(cinder, 'volume', name,
+                        lambda: paging.paged_search(cinder.volumes.list),
+                        name_key='display_name'):
+        return volume
     return None
 
 def find_user(keystone, name):
     if not name:
         return None
-    for user in keystone.users.list():
-        if user.name == name:
-            return user
+    for user in _find(keystone, 'user', name,
+                      lambda: paging.paged(keystone.users.list)):
+        return user
     return None
 
 def find_role(keystone, name):
     if not name:
         return None
-    for role in keystone.roles.list():
-        if name.lower() == role.name.lower():
-            return role
+    def lister():
+        for role in keystone.roles.list():
+            yield role.name.lower(), role
+    for role in name_index.find(keystone, 'role', name.lower(), lister):
+        return role
     return None
 
 def find_project(keystone, name):
     if not name:
         return None
-    for tenant in keystone.tenants.list():
-        if tenant.name == name:
-            return tenant
+    for tenant in _find(keystone, 'project', name,
+                        lambda: paging.paged(keystone.tenants.list)):
+        return tenant
     return None
 
+def _not_found(error):
+    # Client exceptions name the status code differently
+    return 404 in [getattr(error, 'code', None),
+                   getattr(error, 'http_status', None)]
+
+def find_by_id(client, resource, obj_id, get_function):
+    '''Return object with id, None if it does not exist
+
+    Each id is got once per scope, like the filtered lookups of the index.
+    '''
+    def lookup():
+        try:
+            obj = get_function(obj_id)
+        except Exception as e: #pylint: disable=broad-except
+            if _not_found(e):
+                return []
+            raise
+        return [obj] if obj is not None else []
+    for obj in name_index.find_filtered(client, resource, {'id' : obj_id},
+                                        lookup):
+        return obj
+    return None
+
+def _find_neutron(neutron, resource, list_function, fields, **filters):
+    # Filter on the server and only return fields lookups need
+    filters = dict((k, v) for k, v in filters.items() if v)
+    lookup = lambda: paging.paged_neutron(list_function, resource,
+                                          fields=fields, **filters)
+    return name_index.find_filtered(neutron, resource, filters, lookup)
+
 def find_network(neutron, name, tenant_id):
-    for net in neutron.list_networks()['networks']:
-        if net['name'] == name:
-            if tenant_id:
-                if tenant_id == net['tenant_id']:
-                    return net
-            else:
-                return net
+    if not name:
+        return None
+    for net in _find_neutron(neutron, 'network', neutron.list_networks,
+                             NEUTRON_FIELDS['network'],
+                             name=name, tenant_id=tenant_id):
+        return net
     return None
 
 def find_subnet(neutron, name, tenant_id, network_id):
-    for sub in neutron.list_subnets()['subnets']:
-        if sub['name'] == name:
-            if network_id:
-                if sub['network_id'] == network_id:
-                    return sub
-            elif tenant_id:
-                if tenant_id == sub['tenant_id']:
-                    return sub
-            else:
-                return sub
+    if not name:
+        return None
+    if network_id:
+        # network id already limits subnets to one tenant
+        tenant_id = None
+    for sub in _find_neutron(neutron, 'subnet', neutron.list_subnets,
+                             NEUTRON_FIELDS['subnet'], name=name,
+                             tenant_id=tenant_id, network_id=network_id):
+        return sub
     return None
 
 def find_router(neutron, name, tenant_id):
-    for router in neutron.list_routers()['routers']:
-        if router['name'] == name:
-            if tenant_id:
-                if tenant_id == router['tenant_id']:
-                    return router
-            else:
-                return router
+    if not name:
+        return None
+    for router in _find_neutron(neutron, 'router', neutron.list_routers,
+                                NEUTRON_FIELDS['router'],
+                                name=name, tenant_id=tenant_id):
+        return router
     return None
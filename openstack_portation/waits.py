@@ -0,0 +1,75 @@
+from openstack_portation.cache import NameIndex
+
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+class PendingWait(object):
+    '''Wait on an image, volume or server registered but not yet done'''
+    def __init__(self, client, key, name, obj_id, timeout, interval):
+        self.client = client
+        self.key = key
+        self.name = name
+        self.obj_id = obj_id
+        self.interval = interval
+        self.registered = time.time()
+        self.expires = self.registered + timeout
+
+
+class DeferredWaits(object):
+    '''Waits that only block once a later section references the resource
+
+    Pending waits of the same type and credentials are waited on together,
+    with one list call per poll.
+    '''
+    def __init__(self):
+        self.pending = {}
+        self.deferred = 0
+        self.blocked_seconds = 0
+        self.overlapped_seconds = 0
+
+    def add(self, client, key, name, obj_id, timeout, interval):
+        log.debug('Deferring wait for %s:%s' % (key, obj_id))
+        self.pending[(key, name)] = PendingWait(client, key, name, obj_id,
+                                                timeout, interval)
+        self.deferred += 1
+
+    def wait_refs(self, refs):
+        '''Wait on pending resources in list of (key, name) references'''
+        waits = [self.pending.pop(ref) for ref in refs if ref in self.pending]
+        if waits:
+            self.__wait(waits)
+
+    def wait_all(self):
+        waits = self.pending.values()
+        self.pending = {}
+        if waits:
+            self.__wait(waits)
+
+    def __wait(self, waits):
+        start = time.time()
+        groups = {}
+        for pending in waits:
+            scope = NameIndex.scope(pending.client.nova)
+            groups.setdefault((pending.key, scope), []).append(pending)
+            # Time the resource was building while the import went on,
+            # .. upper bound as it may have finished before now
+            self.overlapped_seconds += start - pending.registered
+        for (key, _), group in sorted(groups.items()):
+            timeout = max(max(p.expires for p in group) - time.time(), 0)
+            interval = min(p.interval for p in group)
+            results = group[0].client.wait_for(key, [p.obj_id for p in group],
+                                               timeout=timeout,
+                                               interval=interval)
+            for pending in group:
+                if results.get(pending.obj_id) is None:
+                    log.error('Wait failed for %s:%s' % (key, pending.obj_id))
+        self.blocked_seconds += time.time() - start
+
+    def stats(self):
+        return {
+            'deferred' : self.deferred,
+            'blocked_seconds' : round(self.blocked_seconds, 2),
+            'overlapped_seconds' : round(self.overlapped_seconds, 2),
+        }
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
+from openstack_portation import plan
+from openstack_portation import serialize
 from openstack_portation.client import PortationClient
+from openstack_portation.fingerprints import FingerprintStore
+from openstack_portation.journal import Journal
+from openstack_portation.trace import tracer
 
 import argparse
+import cProfile
+import itertools
 import logging
 import os
 import sys
-import yaml
 
 log_format = '%(asctime)s-%(levelname)s-%(message)s'
 log = logging.getLogger('openstack_portation')
@@ -23,12 +29,41 @@ def parse_args():
     p.add_argument('--tenant-name', help='OpenStack Auth tenant name')
     p.add_argument('--auth-url', help='OpenStack Auth keystone url')
     p.add_argument('--debug', action='store_true', help='Show debug output')
+    p.add_argument('--metrics-file',
+                   help='Write per operation API call stats to file as JSON')
+    p.add_argument('--profile',
+                   help='Write timeline of actions, sections, export stages, '
+                        'API calls and waits to file in Chrome trace format')
+    p.add_argument('--profile-cpu',
+                   help='Write cProfile stats of the main thread to file')
 
     sub = p.add_subparsers(dest='command', help='Command')
     imp = sub.add_parser('import', help='Import config')
     imp.add_argument('config_file', help='Config file to import')
+    imp.add_argument('--format', choices=serialize.FORMATS,
+                     help='Config file format, default from file extension')
+    imp.add_argument('--concurrency', type=int, default=1,
+                     help='Number of sections to import at once, sections are '
+                          'run as soon as the resources they use exist')
+    imp.add_argument('--journal', nargs='?', const='',
+                     help='Record completed actions in file, default is the '
+                          'config file name with .journal appended, removed '
+                          'once the import succeeds')
+    imp.add_argument('--resume', action='store_true',
+                     help='Skip actions the journal has as completed with '
+                          'the same spec, implies --journal')
+    imp.add_argument('--plan', action='store_true',
+                     help='Show what the import would create and update, '
+                          'without making any changes')
+    imp.add_argument('--skip-unchanged', action='store_true',
+                     help='Skip actions imported before with the same spec '
+                          'whose resources still exist')
     exp = sub.add_parser('export', help='Export config')
     exp.add_argument('config_file', help='Export output file')
+    exp.add_argument('--format', choices=serialize.FORMATS,
+                     help='Output file format, default from file extension')
+    exp.add_argument('--concurrency', type=int, default=1,
+                     help='Number of tenants or images to export at once')
     exp.add_argument('--images',
                      help='Download cluster images,'
                           'input save directory for data(None for just metadata')
@@ -47,30 +82,84 @@ def get_env_args(args):
             sys.exit('')
     return args
 
-def write_config(config_file, data):
-    with open(config_file, 'w') as f:
-        log.debug('Writing data to file:%s' % config_file)
-        f.write(yaml.dump(data))
-    log.info("Saved metadata info to file:%s" % config_file)
+def write_config(config_file, records, file_format):
+    log.debug('Writing data to file:%s' % config_file)
+    count = serialize.write_records(config_file, records,
+                                    file_format=file_format)
+    log.info("Saved %s records to file:%s" % (count, config_file))
+
+def run_command(a, args):
+    if args.command == 'import':
+        log.debug('Loading configs from:%s' % args.config_file)
+        with tracer.span('load config', 'local'):
+            config_data = serialize.load_records(args.config_file,
+                                                 file_format=args.format)
+        if args.plan:
+            log.info('Import plan:\n%s' % plan.format_plan(
+                a.plan_config(config_data)))
+        else:
+            journal_file = args.journal or args.config_file + '.journal'
+            unfinished = not args.resume and os.path.isfile(journal_file) and \
+                os.path.getsize(journal_file)
+            if unfinished:
+                log.warning('Journal of an unfinished import exists, use '
+                            '--resume to skip its completed actions:%s' %
+                            journal_file)
+            journal = None
+            if args.journal is not None or args.resume:
+                if unfinished:
+                    # Never truncate it, keep it beside the new one
+                    os.rename(journal_file, journal_file + '.old')
+                    log.warning('Moved unfinished journal to:%s.old' %
+                                journal_file)
+                journal = Journal(journal_file, resume=args.resume)
+            fingerprints = FingerprintStore() if args.skip_unchanged else None
+            try:
+                a.import_config(config_data, concurrency=args.concurrency,
+                                journal=journal, fingerprints=fingerprints)
+            finally:
+                if journal:
+                    journal.close()
+                if fingerprints:
+                    fingerprints.close()
+            if journal:
+                os.remove(journal_file)
+    elif args.command == 'export':
+        # Records are written as they are exported
+        records = a.iter_export_config(concurrency=args.concurrency)
+        if args.images:
+            records = itertools.chain(records,
+                                      a.iter_export_images(args.images,
+                                                           concurrency=args.concurrency))
+        write_config(args.config_file, records, args.format)
 
 def main():
     log.debug('Reading CLI args')
     args = get_env_args(parse_args())
     if args.debug:
         log.setLevel(logging.DEBUG)
+    if args.profile:
+        # Enabled first so authentication is on the timeline too
+        tracer.enable()
     log.debug('Initialzing Client')
     a = PortationClient(args.username,
                         args.password,
                         args.tenant_name,
                         args.auth_url)
-    if args.command == 'import':
-        with open(args.config_file, 'r') as f:
-            log.debug('Loading configs from:%s' % args.config_file)
-            config_data = yaml.load(f)
-            a.import_config(config_data)
-    elif args.command == 'export':
-        data = a.export_config()
-        write_config(args.config_file, data)
-        if args.images:
-            data += a.export_images(args.images)
-            write_config(args.config_file, data)
+    profiler = None
+    if args.profile_cpu:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with tracer.span(args.command, 'run'):
+            run_command(a, args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_cpu)
+            log.info('Saved CPU profile to file:%s' % args.profile_cpu)
+        if args.profile:
+            tracer.write(args.profile)
+    log.info('API call stats:\n%s' % a.metrics.report())
+    if args.metrics_file:
+        a.metrics.dump(args.metrics_file)
@@ -14,6 +14,8 @@ setuptools.setup(
         'python-neutronclient',
         'python-novaclient',
 
+        'futures >= 3.0.0',
+        'jsonschema',
         'nose >= 1.3.7',
         'pycrypto >= 2.6.1',
         'PyYAML >= 3.11',
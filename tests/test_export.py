@@ -1,3 +1,4 @@
+from openstack_portation import settings
 from openstack_portation import utils
 
 from tests import utils as test_utils
@@ -191,3 +192,20 @@ class TestExport(test_utils.TestClient):
         new_data = self.client.export_images(None).\
                          sort_by_keys()['image']
         self.assertNotEqual(cmp(original_data, new_data), 0)
+
+    def test_concurrency(self):
+        # Concurrent export should match serial export, order included
+        serial_data = self.client.export_config()
+        concurrent_data = self.client.export_config(concurrency=4)
+        self.assertEqual(cmp(list(serial_data), list(concurrent_data)), 0)
+
+    def test_paging(self):
+        # Export listed a page at a time should match a one page export
+        original_data = self.client.export_config()
+        page_size = settings.LIST_PAGE_SIZE
+        settings.LIST_PAGE_SIZE = 2
+        try:
+            paged_data = self.client.export_config()
+        finally:
+            settings.LIST_PAGE_SIZE = page_size
+        self.assertEqual(cmp(list(original_data), list(paged_data)), 0)
@@ -1,7 +1,12 @@
+import copy
 import os
 
+from openstack_portation.exceptions import ConfigValidationError
 from openstack_portation.exceptions import OpenStackPortationError
+from openstack_portation.fingerprints import FingerprintStore
+from openstack_portation.journal import Journal
 from openstack_portation import utils
+from openstack_portation.trace import tracer
 
 from tests import utils as test_utils
 
@@ -33,6 +38,87 @@ class TestImport(test_utils.TestClient):
         ]
         self.results = self.client.import_config(keystone_data)
 
+    def test_plan(self):
+        user_name = utils.random_string()
+        keystone_data = [
+            {
+                'user' : {
+                    'password' : utils.random_string(),
+                    'name' : user_name,
+                    'email' : None,
+                },
+            },
+            {
+                'project' : {
+                    'description' : utils.random_string(),
+                    'role' : 'admin',
+                    'user' : user_name,
+                    'name' : utils.random_string(),
+                },
+            }
+        ]
+        entries = self.client.plan_config(keystone_data)
+        self.assertEqual([e.action for e in entries], ['create', 'create'])
+        self.results = self.client.import_config(copy.deepcopy(keystone_data))
+        # applied config plans no changes
+        entries = self.client.plan_config(keystone_data)
+        self.assertEqual([e.action for e in entries], ['none', 'none'])
+        keystone_data[1]['project']['description'] = utils.random_string()
+        entries = self.client.plan_config(keystone_data)
+        self.assertEqual(entries[1].action, 'update')
+        self.assertEqual(entries[1].changes.keys(), ['description'])
+
+    def test_journal_resume(self):
+        flavor_data = [
+            {
+                'flavor' : {
+                    'vcpus' : 1,
+                    'disk' : 0,
+                    'ram' : 512,
+                    'name' : utils.random_string(),
+                }
+            },
+        ]
+        journal_file = os.path.join('/tmp', utils.random_string(prefix='journal-'))
+        with test_utils.temp_file(journal_file) as _:
+            journal = Journal(journal_file)
+            self.results = self.client.import_config(
+                copy.deepcopy(flavor_data), journal=journal)
+            journal.close()
+            # completed action is skipped, results come from the journal
+            journal = Journal(journal_file, resume=True)
+            utils.name_index.reset_stats()
+            results = self.client.import_config(copy.deepcopy(flavor_data),
+                                                journal=journal)
+            journal.close()
+            self.assertEqual(list(results), list(self.results))
+            self.assertEqual(utils.name_index.stats()['misses'], 0)
+
+    def test_skip_unchanged(self):
+        flavor_data = [
+            {
+                'flavor' : {
+                    'vcpus' : 1,
+                    'disk' : 0,
+                    'ram' : 512,
+                    'name' : utils.random_string(),
+                }
+            },
+        ]
+        db_file = os.path.join('/tmp', utils.random_string(prefix='prints-'))
+        with test_utils.temp_file(db_file) as _:
+            fingerprints = FingerprintStore(db_file)
+            self.results = self.client.import_config(
+                copy.deepcopy(flavor_data), fingerprints=fingerprints)
+            # unchanged action is skipped, results come from the store
+            utils.name_index.reset_stats()
+            results = self.client.import_config(copy.deepcopy(flavor_data),
+                                                fingerprints=fingerprints)
+            fingerprints.close()
+            self.assertEqual(list(results), list(self.results))
+            # only the flavor is got, to check it still exists
+            self.assertEqual(utils.name_index.stats()['misses'], 1)
+
     def test_source_file(self):
         user_name = utils.random_string()
         project_name = utils.random_string()
@@ -84,6 +170,56 @@ class TestImport(test_utils.TestClient):
         keystone_data[0]['user']['password'] = utils.random_string(prefix='new')
         self.results = self.client.import_config(keystone_data)
 
+    def test_schema_errors(self):
+        bad_data = [
+            {
+                'user' : {
+                    'name' : utils.random_string(),
+                },
+            },
+            {
+                'flavor' : {
+                    'name' : utils.random_string(),
+                    'vcpus' : 1,
+                    'disk' : 0,
+                    'ram' : 512,
+                },
+            },
+            {
+                'project' : {
+                    'description' : utils.random_string(),
+                },
+            },
+        ]
+        with self.assertRaises(ConfigValidationError) as context:
+            self.client.import_config(bad_data)
+        # every invalid action reported in one pass
+        indices = set(error[0] for error in context.exception.errors)
+        self.assertEqual(indices, set([0, 2]))
+
+    def test_keystone_concurrency(self):
+        users = [utils.random_string() for _ in range(3)]
+        keystone_data = []
+        for user_name in users:
+            keystone_data.append({
+                'user' : {
+                    'password' : utils.random_string(),
+                    'name' : user_name,
+                    'email' : None,
+                },
+            })
+            keystone_data.append({
+                'project' : {
+                    'role' : 'admin',
+                    'user' : user_name,
+                    'name' : utils.random_string(),
+                },
+            })
+        self.results = self.client.import_config(keystone_data, concurrency=4)
+        # results keep config order
+        keys = [result.keys()[0] for result in self.results]
+        self.assertEqual(keys, ['user', 'project'] * 3)
+
     def test_flavors(self):
         flavor_name = utils.random_string()
         flavor_data = [
@@ -154,6 +290,98 @@ class TestImport(test_utils.TestClient):
         self.assertRaises(OpenStackPortationError,
                           self.client.import_config, quota_data)
 
+    def test_name_index(self):
+        project_name = utils.random_string()
+        quota_data = [
+            {
+                'project' : {
+                    'name' : project_name,
+                }
+            },
+            {
+                'nova_quota' : {
+                    "instances": 20,
+                    "tenant_name": project_name,
+                },
+                "cinder_quota": {
+                    "volumes": 20,
+                    "tenant_name": project_name,
+                },
+            },
+        ]
+        utils.name_index.reset_stats()
+        self.results = self.client.import_config(quota_data)
+        # projects listed once, second quota lookup served from index
+        self.assertEqual(utils.name_index.misses, 1)
+        self.assertTrue(utils.name_index.hits >= 1)
+
+    def test_client_pool(self):
+        flavor_data = [
+            {
+                'flavor' : {
+                    'vcpus' : 1,
+                    'disk' : 0,
+                    'ram' : 512,
+                    'name' : utils.random_string(),
+                }
+            },
+            {
+                'flavor' : {
+                    'vcpus' : 1,
+                    'disk' : 0,
+                    'ram' : 512,
+                    'name' : utils.random_string(),
+                }
+            },
+        ]
+        self.results = self.client.import_config(flavor_data)
+        # both actions use the clients created by setup
+        stats = self.client.pool.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+        # requests after the first reuse kept-alive connections
+        http_stats = self.client.pool.http.stats()
+        self.assertTrue(http_stats['reused'] > 0)
+        self.assertTrue(http_stats['connections'] < http_stats['requests'])
+
+    def test_api_metrics(self):
+        flavor_data = [
+            {
+                'flavor' : {
+                    'vcpus' : 1,
+                    'disk' : 0,
+                    'ram' : 512,
+                    'name' : utils.random_string(),
+                }
+            },
+        ]
+        self.client.metrics.reset()
+        self.results = self.client.import_config(flavor_data)
+        summary = self.client.metrics.summary()
+        operations = [(row['service'], row['operation']) for row in summary]
+        self.assertTrue(('nova', 'POST /flavors') in operations)
+        for row in summary:
+            self.assertTrue(row['p50'] <= row['p95'] <= row['max'])
+
+    def test_trace(self):
+        flavor_data = [
+            {
+                'flavor' : {
+                    'vcpus' : 1,
+                    'disk' : 0,
+                    'ram' : 512,
+                    'name' : utils.random_string(),
+                }
+            },
+        ]
+        tracer.enable()
+        try:
+            self.results = self.client.import_config(flavor_data)
+        finally:
+            tracer.disable()
+        categories = set(event['cat'] for event in tracer.events)
+        self.assertTrue(set(['action', 'section', 'nova']) <= categories)
+
     def test_security_group(self):
         secgroup_name = utils.random_string()
         sec_data = [
@@ -176,6 +404,32 @@ class TestImport(test_utils.TestClient):
         sec_group = self.results.sort_by_keys()['security_group'][0]
         self.assertTrue('os_tenant_name' in sec_group.keys())
 
+    def test_security_group_rules(self):
+        rule = lambda port: {
+            'to_port': port,
+            'cidr' : '0.0.0.0/0',
+            'from_port': port,
+            'ip_protocol' : 'tcp'
+        }
+        sec_data = [
+            {
+                'security_group' : {
+                    'rules' : [rule(22), rule(80)],
+                    'name' : utils.random_string(),
+                    'description' : utils.random_string(),
+                },
+            },
+        ]
+        self.client.import_config(sec_data)
+        # 22 is kept, 443 created and 80 removed
+        sec_data[0]['security_group']['rules'] = [rule(22), rule(443)]
+        sec_data[0]['security_group']['prune_rules'] = True
+        self.results = self.client.import_config(sec_data)
+        group_id = self.results[0]['security_group']
+        group = self.client.nova.security_groups.get(group_id)
+        ports = sorted(r['from_port'] for r in group.rules)
+        self.assertEqual(ports, [22, 443])
+
     def test_keypair(self):
         keyname = utils.random_string()
         filename = utils.random_string(prefix='/tmp/')
@@ -229,6 +483,38 @@ class TestImport(test_utils.TestClient):
         ]
         self.results = self.client.import_config(neutron_data)
 
+    def test_neutron_bulk(self):
+        project_name = utils.random_string()
+        network_names = [utils.random_string() for _ in range(3)]
+        neutron_data = [
+            {
+                "project": {
+                    "name": project_name,
+                }
+            },
+        ]
+        for name in network_names:
+            neutron_data.append({
+                "network": {
+                    "tenant_name": project_name,
+                    "name": name,
+                }
+            })
+        for index, name in enumerate(network_names):
+            neutron_data.append({
+                "subnet": {
+                    "ip_version": "4",
+                    "tenant_name": project_name,
+                    "cidr": '192.168.%s.0/24' % index,
+                    "name": utils.random_string(),
+                    "network": name,
+                }
+            })
+        self.results = self.client.import_config(neutron_data)
+        # every section has its own result, in config order
+        keys = [result.keys()[0] for result in self.results]
+        self.assertEqual(keys, ['project'] + ['network'] * 3 + ['subnet'] * 3)
+
     def test_glance(self):
         image_name = utils.random_string()
         image_url = "http://cloudhyd.com/openstack/images/cirros-0.3.0-x86_64-disk.img"
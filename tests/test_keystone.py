@@ -0,0 +1,101 @@
+import unittest
+
+from openstack_portation import settings
+from openstack_portation.openstack import keystone as os_keystone
+
+class StandIn(object):
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class StandInKeystone(object):
+    '''Memberships listed in a different order than users and roles'''
+    def __init__(self):
+        users = [StandIn(id='u%d' % i, name='user-%d' % i, enabled=True,
+                         email=None) for i in range(4)]
+        tenants = [StandIn(id='t%d' % i, name='tenant-%d' % i,
+                           description='', enabled=True) for i in range(3)]
+        roles = [StandIn(id='r%d' % i, name='role-%d' % i) for i in range(3)]
+        members = {
+            't0' : [users[2], users[0]],
+            't1' : [],
+            't2' : [users[3], users[1], users[2]],
+        }
+        member_roles = {
+            ('u0', 't0') : [roles[1]],
+            ('u2', 't0') : [roles[2], roles[0]],
+            ('u1', 't2') : [roles[0]],
+            ('u2', 't2') : [roles[1], roles[2]],
+            ('u3', 't2') : [roles[2]],
+        }
+        self.users = StandIn(
+            list=lambda limit=None, marker=None: [] if marker else users,
+            list_roles=lambda user_id, tenant: member_roles.get(
+                (user_id, tenant), []))
+        self.tenants = StandIn(
+            list=lambda limit=None, marker=None: [] if marker else tenants,
+            list_users=lambda tenant_id: members[tenant_id])
+        self.roles = StandIn(list=lambda: roles)
+        self.auth_token = 'token'
+        self.assignments = [
+            StandIn(user={'id' : user_id}, role={'id' : role.id},
+                    scope={'project' : {'id' : tenant_id}})
+            for (user_id, tenant_id), user_roles in member_roles.items()
+            for role in user_roles]
+
+
+class StandInV3(object):
+    '''Client module giving the role assignments of StandInKeystone'''
+    def __init__(self, keystone):
+        self.keystone = keystone
+
+    def Client(self, **_): #pylint: disable=invalid-name
+        return StandIn(role_assignments=StandIn(
+            list=lambda: self.keystone.assignments))
+
+
+class TestKeystoneExport(unittest.TestCase):
+    def setUp(self):
+        self.v3_assignments = settings.EXPORT_V3_ROLE_ASSIGNMENTS
+        self.key_v3 = os_keystone.key_v3
+        self.v3_endpoint = os_keystone._v3_endpoint #pylint: disable=protected-access
+
+    def tearDown(self):
+        settings.EXPORT_V3_ROLE_ASSIGNMENTS = self.v3_assignments
+        os_keystone.key_v3 = self.key_v3
+        os_keystone._v3_endpoint = self.v3_endpoint #pylint: disable=protected-access
+
+    def test_save_keystone(self):
+        # One snapshot gives the records of the three savers, in order
+        settings.EXPORT_V3_ROLE_ASSIGNMENTS = False
+        keystone = StandInKeystone()
+        records = list(os_keystone.save_users(keystone)) + \
+            list(os_keystone.save_projects(keystone)) + \
+            list(os_keystone.save_roles(keystone))
+        self.assertEqual(list(os_keystone.save_keystone(keystone)), records)
+        self.assertEqual(list(os_keystone.save_keystone(keystone,
+                                                        concurrency=4)),
+                         records)
+
+    def test_save_keystone_v3(self):
+        # Same records, members in user order and roles in role order
+        keystone = StandInKeystone()
+        settings.EXPORT_V3_ROLE_ASSIGNMENTS = True
+        os_keystone.key_v3 = StandInV3(keystone)
+        os_keystone._v3_endpoint = lambda _: 'v3' #pylint: disable=protected-access
+        records = list(os_keystone.save_keystone(keystone))
+        roles = [(r['project']['name'], r['project']['user'],
+                  r['project']['role']) for r in records if 'role' in
+                 r.get('project', {})]
+        self.assertEqual(roles, [
+            ('tenant-0', 'user-0', 'role-1'),
+            ('tenant-0', 'user-2', 'role-0'),
+            ('tenant-0', 'user-2', 'role-2'),
+            ('tenant-2', 'user-1', 'role-0'),
+            ('tenant-2', 'user-2', 'role-1'),
+            ('tenant-2', 'user-2', 'role-2'),
+            ('tenant-2', 'user-3', 'role-2'),
+        ])
+        self.assertEqual(records[:-len(roles)],
+                         list(os_keystone.save_users(keystone)) +
+                         list(os_keystone.save_projects(keystone)))
@@ -0,0 +1,86 @@
+import io
+import unittest
+
+from openstack_portation import settings
+from openstack_portation.throttle import Throttle, ThrottledAdapter
+
+from requests.adapters import HTTPAdapter
+from requests.models import PreparedRequest, Response
+
+class StubAdapter(HTTPAdapter):
+    '''Answer with statuses in order, record the body of each send
+
+    A status can be a (status, headers, body) tuple.
+    '''
+    def __init__(self, statuses, **kwargs):
+        self.statuses = list(statuses)
+        self.bodies = []
+        super(StubAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs): #pylint: disable=arguments-differ
+        body = request.body
+        if hasattr(body, 'read'):
+            body = body.read()
+        self.bodies.append(body)
+        status, headers, body = self.statuses.pop(0), {}, b''
+        if isinstance(status, tuple):
+            status, headers, body = status
+        response = Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = io.BytesIO(body)
+        return response
+
+
+class StubThrottledAdapter(ThrottledAdapter, StubAdapter):
+    def __init__(self, statuses):
+        throttle = Throttle(lambda url: 'glance', 1)
+        super(StubThrottledAdapter, self).__init__(throttle, statuses=statuses)
+
+
+class TestThrottle(unittest.TestCase):
+    def setUp(self):
+        self.interval = settings.API_RETRY_INTERVAL
+        settings.API_RETRY_INTERVAL = 0.01
+
+    def tearDown(self):
+        settings.API_RETRY_INTERVAL = self.interval
+
+    @staticmethod
+    def request(body):
+        request = PreparedRequest()
+        request.prepare(method='PUT', url='http://glance/v1/images/1')
+        request.body = body
+        return request
+
+    def test_retry_string_body(self):
+        adapter = StubThrottledAdapter([503, 200])
+        response = adapter.send(self.request(b'image data'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(adapter.bodies, [b'image data', b'image data'])
+
+    def test_no_retry_file_body(self):
+        # A retry would send what is left of the file, nothing
+        adapter = StubThrottledAdapter([503, 200])
+        response = adapter.send(self.request(io.BytesIO(b'image data')))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(adapter.bodies, [b'image data'])
+
+    def test_rate_limited(self):
+        adapter = StubThrottledAdapter([(413, {'Retry-After' : '0.01'}, b''),
+                                        200])
+        response = adapter.send(self.request(None))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(adapter.throttle.stats()['throttled'], 1)
+
+    def test_quota_exceeded(self):
+        # Neither retried nor counted as back-pressure
+        quota = b'{"overLimit": {"code": 413, "message": "Quota exceeded ' \
+            b'for instances", "retryAfter": "5"}}'
+        for answer in [(413, {'Retry-After' : '0'}, b''),
+                       (413, {'Retry-After' : '5'}, quota)]:
+            adapter = StubThrottledAdapter([answer, 200])
+            response = adapter.send(self.request(None))
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(adapter.throttle.stats()['throttled'], 0)
+            self.assertEqual(adapter.throttle.stats()['limits'], {'glance' : 1})